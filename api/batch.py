@@ -0,0 +1,104 @@
+import json
+import os
+import time
+from pathlib import Path
+
+BATCH_ENDPOINT = '/v1/chat/completions'
+TERMINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+# ========================== 批处理请求文件 ==========================
+def make_custom_id(model_key, dataset, idx):
+    return f"{model_key}|{dataset}|{idx}"
+
+def build_request(custom_id, model_name, text, base64_image, extra_body=None):
+    """构造批处理文件中的一行，body 与实时调用 chat.completions.create 的参数一致。"""
+    body = {
+        "model": model_name,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
+                    },
+                    {"type": "text", "text": text},
+                ],
+            }
+        ],
+    }
+    if extra_body:
+        body.update(extra_body)
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+def write_batch_file(path, requests):
+    Path(os.path.dirname(path) or '.').mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for request in requests:
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+    return path
+
+# ========================== 提交与轮询 ==========================
+def submit_batch(client, path, metadata=None):
+    """上传批处理文件并创建批处理任务，返回 batch id。"""
+    with open(path, 'rb') as f:
+        input_file = client.files.create(file=f, purpose='batch')
+    kwargs = {"metadata": metadata} if metadata else {}
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window='24h',
+        **kwargs
+    )
+    print(f"Submitted batch {batch.id} from {path}")
+    return batch.id
+
+def wait_for_batch(client, batch_id, poll_interval=30):
+    """轮询直到批处理任务进入终止状态，返回最终的 batch 对象。"""
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts is not None:
+            print(f"Batch {batch_id}: {batch.status} ({counts.completed}/{counts.total} completed, {counts.failed} failed)")
+        else:
+            print(f"Batch {batch_id}: {batch.status}")
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        time.sleep(poll_interval)
+
+# ========================== 结果解析 ==========================
+def parse_output_line(record, stream_model=False):
+    """
+    解析输出文件中的一行，返回 (custom_id, result, error)。
+
+    stream_model 为 True 时（如 qvq-max），结果与 call_api_stream 相同，
+    为 {"reasoning": ..., "answer": ...}。
+    """
+    custom_id = record["custom_id"]
+    if record.get("error"):
+        return custom_id, "", json.dumps(record["error"], ensure_ascii=False)
+
+    response = record.get("response") or {}
+    body = response.get("body") or {}
+    if response.get("status_code") != 200:
+        error = body.get("error", body) if isinstance(body, dict) else body
+        return custom_id, "", f"Error code: {response.get('status_code')} - {error}"
+
+    message = body["choices"][0]["message"]
+    if stream_model:
+        return custom_id, {"reasoning": message.get("reasoning_content") or "", "answer": message.get("content") or ""}, None
+    return custom_id, message.get("content"), None
+
+def read_batch_results(client, batch, stream_model=False):
+    """下载输出文件和错误文件，返回 {custom_id: (result, error)}。"""
+    results = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = client.files.content(file_id).text
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            custom_id, result, error = parse_output_line(json.loads(line), stream_model)
+            results[custom_id] = (result, error)
+    return results
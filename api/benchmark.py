@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import images
+import translate
+from cache import configure as configure_cache
+from client import configure as configure_client
+from dataio import iter_items
+from metrics import percentile
+from mock_server import add_config_arguments, config_from_args, start_server
+from registry import apply_overrides
+
+# ========================== 基准数据 ==========================
+def prepare_data(data_files, work_dir, limit=None):
+    """把数据文件（可只取前 limit 条）复制到工作目录，返回新文件路径列表。"""
+    paths = []
+    for file_path in data_files:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if limit:
+            data = data[:limit]
+        path = os.path.join(work_dir, 'data', os.path.basename(file_path))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        paths.append(path)
+    return paths
+
+def make_synthetic_images(data_files, image_dir, size=(1024, 768), seed=0):
+    """为数据中引用的每张图片生成随机噪声 JPEG，噪声图几乎不可压缩，编码开销接近真实照片的上限。"""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    os.makedirs(image_dir, exist_ok=True)
+    for file_path in data_files:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            names = {item["image"] for item in json.load(f)}
+        for name in sorted(names):
+            path = os.path.join(image_dir, name)
+            if os.path.exists(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            image = Image.frombytes('RGB', size, rng.randbytes(size[0] * size[1] * 3))
+            image.save(path, format='JPEG', quality=90)
+
+# ========================== 基准测试 ==========================
+def run_once(model_key, data_files, concurrency, max_retries, output_dir, server):
+    """对每个数据文件走一遍 process_single_file，返回本轮的统计结果。"""
+    translate.OUTPUT_BASE_DIR = output_dir
+    translate.CHECKPOINT_DIR = os.path.join(output_dir, 'checkpoints')
+    images.encode_stats(reset=True)
+    mock_before = dict(server.state.counts)
+
+    items = []
+    cpu_started = time.process_time()
+    started = time.monotonic()
+    output_paths = [
+        translate.process_single_file(file_path, model_key, 'bench', concurrency, max_retries)
+        for file_path in data_files
+    ]
+    wall = time.monotonic() - started
+    cpu = time.process_time() - cpu_started
+    for path in output_paths:
+        items.extend(iter_items(path))
+
+    metrics = [item.get("metrics") or {} for item in items]
+    latencies = sorted(m["latency"] for m in metrics if m.get("latency") is not None)
+    total_time = sum(m.get("total_time", 0.0) for m in metrics)
+    retry_wait = sum(m.get("retry_wait", 0.0) for m in metrics)
+    encode = images.encode_stats()
+    return {
+        "concurrency": concurrency,
+        "items": len(items),
+        "failed": sum(1 for item in items if item.get("error")),
+        "wall_seconds": wall,
+        "items_per_second": len(items) / wall if wall else None,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "retries": sum(max(0, m.get("attempts", 1) - 1) for m in metrics),
+        "retry_wait_seconds": retry_wait,
+        # 重试开销：所有条目的总耗时中花在退避与限流等待上的比例
+        "retry_overhead": retry_wait / total_time if total_time else 0.0,
+        "encodes": encode["encodes"],
+        "encode_cpu_seconds": encode["cpu_seconds"],
+        "process_cpu_seconds": cpu,
+        "server_requests": server.state.counts["requests"] - mock_before["requests"],
+        "injected_429": server.state.counts["rate_limited"] - mock_before["rate_limited"],
+        "injected_400": server.state.counts["bad_request"] - mock_before["bad_request"],
+    }
+
+def format_report(rows):
+    header = (f"{'conc':>5} {'items':>6} {'fail':>5} {'wall s':>8} {'items/s':>8} {'p50 s':>7} {'p95 s':>7} "
+              f"{'retries':>7} {'retry%':>7} {'encodes':>7} {'enc cpu s':>9} {'cpu s':>7}")
+    lines = [header]
+    for row in rows:
+        lines.append(
+            f"{row['concurrency']:>5} {row['items']:>6} {row['failed']:>5} {row['wall_seconds']:>8.2f} "
+            f"{row['items_per_second']:>8.1f} {row['latency_p50'] or 0:>7.3f} {row['latency_p95'] or 0:>7.3f} "
+            f"{row['retries']:>7} {row['retry_overhead'] * 100:>6.1f}% {row['encodes']:>7} "
+            f"{row['encode_cpu_seconds']:>9.2f} {row['process_cpu_seconds']:>7.2f}"
+        )
+    return "\n".join(lines)
+
+# ========================== 主函数 ==========================
+def main():
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark of the translation pipeline against a local mock API")
+    parser.add_argument('--model', default='gpt-4o', help="Registry key whose call strategy (stream, image policy, ...) is benchmarked")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32], help="Concurrency settings to compare")
+    parser.add_argument('--max-retries', type=int, default=5)
+    parser.add_argument('--stream', action='store_true', help="Force streaming calls")
+    parser.add_argument('--data-dir', default=translate.DATA_DIR, help="Directory containing the three test files")
+    parser.add_argument('--limit', type=int, default=None, help="Only use the first N items of each file")
+    parser.add_argument('--image-folder', default=None,
+                        help="Folder with the real images; by default synthetic noise images are generated")
+    parser.add_argument('--image-size', type=int, nargs=2, default=[1024, 768], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--json', type=str, default=None, help="Also write the report rows to this JSON file")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_server(config=config_from_args(args))
+    configure_client("mock", base_url, max_connections=max(args.concurrency) + 8)
+    configure_cache(None)
+    images.configure(None)
+    overrides = {"concurrency": max(args.concurrency)}
+    if args.stream:
+        overrides["stream"] = True
+    apply_overrides({args.model: overrides})
+
+    with tempfile.TemporaryDirectory(prefix='ambitrans-bench-') as work_dir:
+        data_files = [os.path.join(args.data_dir, name) for name in ('ambi_normal_test.json', 'sp_test.json', 'mma_test.json')]
+        data_files = prepare_data(data_files, work_dir, args.limit)
+        image_folder = args.image_folder
+        if not image_folder:
+            image_folder = os.path.join(work_dir, 'images')
+            make_synthetic_images(data_files, image_folder, tuple(args.image_size))
+        translate.IMAGE_FOLDER_3AM = translate.IMAGE_FOLDER_MMA = image_folder
+
+        rows = []
+        for concurrency in args.concurrency:
+            rows.append(run_once(args.model, data_files, concurrency, args.max_retries,
+                                 os.path.join(work_dir, f'output-{concurrency}'), server))
+
+    server.shutdown()
+    print(format_report(rows))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import threading
+
+# ========================== 费用上限 ==========================
+class BudgetExceeded(Exception):
+    """模型本次运行的费用已达到上限，不再发送新请求（不重试）。"""
+
+
+class BudgetGuard:
+    """
+    按每次请求尝试（包括重试、被取消的对冲请求与超时请求）的 prompt / completion tokens 与注册表价格
+    累计单个模型本次运行的费用，每次尝试（包括重试）前检查。达到 cap（美元）后暂停该模型：
+    之后的条目不再请求，记为 error，调高上限后用 --resume 继续。
+    已在途的请求仍会完成，因此实际费用可能略超上限。命中缓存的结果不计费。
+    """
+
+    def __init__(self, model_key, cap, input_price, output_price):
+        self.model_key = model_key
+        self.cap = cap
+        self.input_price = input_price
+        self.output_price = output_price
+        self.lock = threading.Lock()
+        self.spent = 0.0
+        self.requests = 0
+        self.skipped = 0
+
+    def check(self):
+        """发送请求前调用，费用已达上限时抛出 BudgetExceeded。"""
+        with self.lock:
+            if self.spent < self.cap:
+                return
+            self.skipped += 1
+        raise BudgetExceeded(f"{self.model_key} reached its budget of ${self.cap:.2f}, request skipped")
+
+    def record(self, metrics, prompt_estimate=0):
+        """
+        累计一次请求尝试（metrics 中的 usage）的费用，失败、被截断或取消的尝试同样计费。
+        被取消的流式请求没有 usage，completion 为已生成部分的估计值；这时 prompt 按 prompt_estimate 估计。
+        """
+        if metrics.get('cached'):
+            return
+        prompt_tokens = metrics.get('prompt_tokens')
+        completion_tokens = metrics.get('completion_tokens')
+        if prompt_tokens is None and completion_tokens:
+            prompt_tokens = prompt_estimate
+        if not prompt_tokens and not completion_tokens:
+            return
+        cost = ((prompt_tokens or 0) * self.input_price + (completion_tokens or 0) * self.output_price) / 1e6
+        with self.lock:
+            self.spent += cost
+            self.requests += 1
+            if self.spent >= self.cap and self.spent - cost < self.cap:
+                print(f"{self.model_key}: budget of ${self.cap:.2f} reached after {self.requests} requests, pausing")
+
+    def report(self):
+        with self.lock:
+            paused = f", paused ({self.skipped} items skipped)" if self.skipped else ""
+            return f"${self.spent:.2f} of ${self.cap:.2f} over {self.requests} requests{paused}"
+
+
+_GUARDS = {}
+_GUARDS_LOCK = threading.Lock()
+
+def configure_budget(model_key, cap, input_price, output_price):
+    """为 model_key 设置费用上限；价格未知时无法计费，抛出 ValueError。"""
+    if input_price is None or output_price is None:
+        raise ValueError(f"{model_key} has a budget but no input_price/output_price in the registry")
+    with _GUARDS_LOCK:
+        _GUARDS[model_key] = BudgetGuard(model_key, cap, input_price, output_price)
+        return _GUARDS[model_key]
+
+def get_budget(model_key):
+    """返回 model_key 的 BudgetGuard，未设置上限时返回 None。"""
+    with _GUARDS_LOCK:
+        return _GUARDS.get(model_key)
+
+def budget_reports():
+    with _GUARDS_LOCK:
+        guards = dict(_GUARDS)
+    return {key: guard.report() for key, guard in guards.items()}
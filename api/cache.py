@@ -0,0 +1,161 @@
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# ========================== API 响应缓存 ==========================
+class ResponseCache:
+    """
+    基于 SQLite 的内容寻址响应缓存。
+
+    键为 (模型名, prompt 文本, 图片字节, extra_body) 的 sha256，值为 API 返回结果的 JSON。
+    总大小超过 max_bytes 时按最近访问时间淘汰（LRU）。
+    """
+
+    def __init__(self, path, max_bytes=1024 * 1024 * 1024):
+        Path(os.path.dirname(path) or '.').mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def contains(self, key):
+        """只检查是否存在，不更新访问时间与命中统计（用于 --dry-run 规划）。"""
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone() is not None
+
+    def put(self, key, value):
+        data = json.dumps(value, ensure_ascii=False)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, data, len(data.encode('utf-8')), time.time())
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        while total > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_CACHE = None
+
+def configure(path=None, max_bytes=1024 * 1024 * 1024):
+    """启用（path 非空）或关闭（path 为 None）进程内共享的响应缓存。"""
+    global _CACHE
+    if _CACHE is not None:
+        _CACHE.close()
+    _CACHE = ResponseCache(path, max_bytes) if path else None
+    return _CACHE
+
+def get_cache():
+    return _CACHE
+
+# ========================== 缓存键 ==========================
+_IMAGE_DIGESTS = {}
+_IMAGE_DIGESTS_LOCK = threading.Lock()
+
+def image_digest(image_path):
+    """图片内容的 sha256，按 (路径, mtime, 大小) 在进程内记忆，重试时不重复读文件。"""
+    stat = os.stat(image_path)
+    marker = (image_path, stat.st_mtime_ns, stat.st_size)
+    with _IMAGE_DIGESTS_LOCK:
+        digest = _IMAGE_DIGESTS.get(marker)
+    if digest is None:
+        with open(image_path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        with _IMAGE_DIGESTS_LOCK:
+            _IMAGE_DIGESTS[marker] = digest
+    return digest
+
+# 会改变返回内容的调用选项（如答案长度上限），设置时参与缓存键
+KEY_OPTIONS = ('max_answer_tokens',)
+
+def make_key(model_name, text, image_path, extra_body=None, image_policy='raw', options=None):
+    fields = {
+        "model": model_name,
+        "prompt": text,
+        "image": image_digest(image_path),
+        "image_policy": image_policy,
+        "extra_body": extra_body,
+    }
+    # 未设置时不写入，保证已有缓存键保持不变
+    key_options = {k: options[k] for k in KEY_OPTIONS if options and options.get(k) is not None}
+    if key_options:
+        fields["options"] = key_options
+    payload = json.dumps(fields, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def is_cached(model_name, text, image_path, extra_body=None, image_policy='raw', options=None):
+    """缓存中是否已有该请求的结果；缓存未启用或图片不存在时返回 False。"""
+    cache = get_cache()
+    if cache is None:
+        return False
+    try:
+        key = make_key(model_name, text, image_path, extra_body, image_policy, options)
+    except OSError:
+        return False
+    return cache.contains(key)
+
+def cached():
+    """
+    装饰 call_xxx(text, image, model_name, image_policy, extra_body, **options) 形式的 API 调用函数：
+    缓存启用时先查缓存，未命中再真正请求并写入缓存；出错的请求不会被缓存。
+    options（如超时、metrics）不影响返回内容，不参与缓存键；KEY_OPTIONS 中的选项除外。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(text, image, model_name, image_policy='raw', extra_body=None, **options):
+            cache = get_cache()
+            if cache is None:
+                return func(text, image, model_name, image_policy, extra_body, **options)
+            key = make_key(model_name, text, image, extra_body, image_policy, options)
+            value = cache.get(key)
+            if value is not None:
+                if options.get('metrics') is not None:
+                    options['metrics']['cached'] = True
+                return value
+            value = func(text, image, model_name, image_policy, extra_body, **options)
+            cache.put(key, value)
+            return value
+        return wrapper
+    return decorator
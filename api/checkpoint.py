@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+# ========================== 断点续跑 ==========================
+class Checkpoint:
+    """
+    追加写入的 JSONL 断点文件，每完成一个条目写一行：
+    {"model": ..., "dataset": ..., "idx": ..., "item": {...}}
+
+    文件只追加不覆盖；同一 (model, dataset, idx) 出现多次时以最后一行为准。
+    进程中途崩溃时最后一行可能不完整，读取时会跳过无法解析的行。
+
+    内存中只保存每个条目最后一行的文件偏移与是否成功，需要结果时再从文件读取，
+    因此内存占用与数据集大小基本无关。
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.index = {}
+
+        Path(os.path.dirname(path) or '.').mkdir(parents=True, exist_ok=True)
+        if resume and os.path.exists(path):
+            self.index = load_index(path)
+        self.file = open(path, 'ab')
+        if _ends_without_newline(path):
+            # 上次崩溃留下的半行，先补换行，避免与新记录粘连
+            self.file.write(b"\n")
+            self.file.flush()
+        self.reader = open(path, 'rb')
+
+    def is_done(self, model, dataset, idx):
+        """已成功完成（没有 error 字段）的条目在 --resume 时跳过，失败的条目会重新请求。"""
+        entry = self.index.get((model, dataset, idx))
+        return entry is not None and entry[1]
+
+    def append(self, model, dataset, item):
+        line = json.dumps(
+            {"model": model, "dataset": dataset, "idx": item["idx"], "item": item},
+            ensure_ascii=False
+        )
+        with self.lock:
+            offset = self.file.tell()
+            self.file.write((line + "\n").encode('utf-8'))
+            self.file.flush()
+            self.index[(model, dataset, item["idx"])] = (offset, "error" not in item)
+
+    def get(self, model, dataset, idx):
+        """读取某个条目最后一次记录的结果，没有记录时返回 None。"""
+        entry = self.index.get((model, dataset, idx))
+        if entry is None:
+            return None
+        with self.lock:
+            return read_record(self.reader, entry[0])["item"]
+
+    def collect(self, model, dataset, data):
+        """按 data 中的原始顺序，从断点记录中逐条取出该 (模型, 数据集) 的结果。"""
+        for item in data:
+            yield self.get(model, dataset, item["idx"])
+
+    def close(self):
+        self.file.close()
+        self.reader.close()
+
+
+def _ends_without_newline(path):
+    if os.path.getsize(path) == 0:
+        return False
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+def _iter_records(path):
+    """逐行读取断点文件，返回 (偏移, 记录)，跳过空行与无法解析的行。"""
+    with open(path, 'rb') as f:
+        offset = 0
+        for line in f:
+            start = offset
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+            yield start, record
+
+
+def load_index(path):
+    """读取断点文件，返回 {(model, dataset, idx): (偏移, 是否成功)}，同一条目以最后一行为准。"""
+    return {
+        (record["model"], record["dataset"], record["idx"]): (offset, "error" not in record["item"])
+        for offset, record in _iter_records(path)
+    }
+
+
+def read_record(f, offset):
+    """从以二进制方式打开的断点文件中读取偏移处的一行记录。"""
+    f.seek(offset)
+    return json.loads(f.readline())
@@ -0,0 +1,130 @@
+import threading
+
+# ========================== 连接指标 ==========================
+class ConnectionMetrics:
+    """
+    通过 httpcore 的 trace 扩展统计新建 TCP 连接数、TLS 握手次数和请求数，
+    用于确认高并发时连接被复用，而不是把延迟花在重新建连上。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.tcp_connects = 0
+        self.tls_handshakes = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def trace(self, event_name, info):
+        with self.lock:
+            if event_name == 'connection.connect_tcp.complete':
+                self.tcp_connects += 1
+            elif event_name == 'connection.start_tls.complete':
+                self.tls_handshakes += 1
+            elif event_name.endswith('.send_request_headers.started'):
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            elif event_name.endswith('.response_closed.complete'):
+                self.in_flight -= 1
+
+    def on_request(self, request):
+        request.extensions['trace'] = self.trace
+        with self.lock:
+            self.requests += 1
+
+# ========================== HTTP 客户端 ==========================
+_CLIENT = None
+_HTTP_CLIENT = None
+_SETTINGS = None
+_LOCK = threading.Lock()
+_METRICS = ConnectionMetrics()
+
+def build_http_client(max_connections=64, http2=False, timeout=600.0, connect_timeout=10.0, metrics=None):
+    """
+    构造共享的 httpx 连接池。
+
+    :param max_connections: 连接池上限，应与所有模型的并发数之和相当
+    :param http2:           是否启用 HTTP/2（需要安装 h2，未安装时退回 HTTP/1.1）
+    :param timeout:         默认的读写超时（秒），各模型在注册表中用 timeout 单独设置并按请求传入
+    """
+    import httpx
+
+    metrics = metrics or _METRICS
+    kwargs = {
+        "limits": httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=60.0
+        ),
+        "timeout": httpx.Timeout(timeout, connect=connect_timeout),
+        "event_hooks": {"request": [metrics.on_request]},
+    }
+    try:
+        return httpx.Client(http2=http2, **kwargs)
+    except ImportError:
+        print("Warning: http2 requested but the 'h2' package is not installed, falling back to HTTP/1.1")
+        return httpx.Client(**kwargs)
+
+def read_key_file(path):
+    """API 配置文件：第一行为 API key，第二行为 base URL。"""
+    with open(path, 'r') as f:
+        lines = f.readlines()
+    return lines[0].strip(), lines[1].strip()
+
+def configure(api_key=None, base_url=None, max_connections=64, http2=False, timeout=600.0, key_file=None):
+    """
+    设置进程内共享的 OpenAI 客户端参数，所有模型共用同一个连接池。
+    客户端在第一次 get_client() 时才创建；未直接给出 api_key 时届时再从 key_file 读取，
+    因此 --help、--dry-run 等不发请求的运行不需要 API 配置文件，也不导入 openai / httpx。
+    """
+    global _CLIENT, _HTTP_CLIENT, _SETTINGS
+    with _LOCK:
+        if _HTTP_CLIENT is not None:
+            _HTTP_CLIENT.close()
+        _CLIENT = _HTTP_CLIENT = None
+        _SETTINGS = {
+            "api_key": api_key,
+            "base_url": base_url,
+            "key_file": key_file,
+            "max_connections": max_connections,
+            "http2": http2,
+            "timeout": timeout,
+        }
+
+def get_client():
+    global _CLIENT, _HTTP_CLIENT
+    if _CLIENT is not None:
+        return _CLIENT
+    with _LOCK:
+        if _CLIENT is None:
+            if _SETTINGS is None:
+                raise RuntimeError("API client is not configured, call client.configure() first")
+            from openai import OpenAI
+
+            api_key, base_url = _SETTINGS["api_key"], _SETTINGS["base_url"]
+            if api_key is None:
+                api_key, base_url = read_key_file(_SETTINGS["key_file"])
+            _HTTP_CLIENT = build_http_client(_SETTINGS["max_connections"], _SETTINGS["http2"], _SETTINGS["timeout"])
+            # 重试统一由 ratelimit.call_with_retry 负责（按错误类型分类、遵守 Retry-After 并暂停限流器），
+            # 关闭 SDK 自带的重试，避免两层重试叠加且不计入统计
+            _CLIENT = OpenAI(api_key=api_key, base_url=base_url, http_client=_HTTP_CLIENT, max_retries=0)
+    return _CLIENT
+
+def connections_in_use():
+    """当前连接池中正在使用的连接数；无法读取连接池状态时返回 None。"""
+    try:
+        pool = _HTTP_CLIENT._transport._pool
+        return sum(1 for connection in pool.connections if not connection.is_idle())
+    except AttributeError:
+        return None
+
+def connection_stats():
+    in_use = connections_in_use()
+    with _METRICS.lock:
+        return {
+            "requests": _METRICS.requests,
+            "tcp_connects": _METRICS.tcp_connects,
+            "tls_handshakes": _METRICS.tls_handshakes,
+            "connections_in_use": in_use,
+            "peak_requests_in_flight": _METRICS.peak_in_flight,
+        }
@@ -0,0 +1,160 @@
+import json
+import os
+from pathlib import Path
+
+# ========================== 流式读取 ==========================
+READ_CHUNK_SIZE = 1 << 16
+
+def iter_items(path):
+    """
+    逐条读取数据文件，不把整个文件载入内存。
+    .jsonl 按行解析；其余按 JSON 数组增量解析（每次只保留当前未解析完的一段文本）。
+    """
+    if path.endswith('.jsonl'):
+        yield from _iter_jsonl(path)
+    else:
+        yield from _iter_json_array(path)
+
+def _iter_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def _iter_json_array(path):
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = ""
+        pos = 0
+        eof = False
+        started = False
+        expect_value = False
+
+        def fill():
+            nonlocal buffer, pos, eof
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                eof = True
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return
+                fill()
+
+        skip_whitespace()
+        if pos >= len(buffer) or buffer[pos] != '[':
+            raise ValueError(f"{path}: expected a JSON array")
+        pos += 1
+
+        while True:
+            skip_whitespace()
+            if pos >= len(buffer):
+                raise ValueError(f"{path}: unexpected end of file")
+            if not expect_value:
+                if buffer[pos] == ']':
+                    return
+                if started:
+                    if buffer[pos] != ',':
+                        raise ValueError(f"{path}: expected ',' or ']'")
+                    pos += 1
+                    expect_value = True
+                    continue
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                    break
+                except json.JSONDecodeError:
+                    # 当前缓冲区中的对象不完整，继续读取
+                    if eof:
+                        raise
+                    fill()
+            # 数字等标量可能在缓冲区末尾被截断（如 "15000000000." 只解析出整数部分），
+            # 读到其后的 ',' 或 ']' 再确认；对象、数组与字符串有结束符，不会被截断
+            if not isinstance(item, (dict, list, str)) and not eof:
+                nxt = end
+                while nxt < len(buffer) and buffer[nxt].isspace():
+                    nxt += 1
+                if nxt == len(buffer) or buffer[nxt] not in ',]':
+                    fill()
+                    continue
+            pos = end
+            started = True
+            expect_value = False
+            yield item
+
+# ========================== 流式写出 ==========================
+class ResultWriter:
+    """
+    逐条写出结果，格式与 json.dump(results, f, ensure_ascii=False, indent=4) 相同；
+    路径以 .jsonl 结尾时每行一条。先写临时文件，close() 时原子替换，中途失败不会留下半个文件。
+    """
+
+    def __init__(self, path):
+        Path(os.path.dirname(path) or '.').mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.jsonl = path.endswith('.jsonl')
+        self.tmp_path = f"{path}.{os.getpid()}.tmp"
+        self.file = open(self.tmp_path, 'w', encoding='utf-8')
+        self.count = 0
+        self.finished = False
+        if not self.jsonl:
+            self.file.write("[")
+
+    def write(self, item):
+        if self.jsonl:
+            self.file.write(json.dumps(item, ensure_ascii=False) + "\n")
+        else:
+            text = json.dumps(item, ensure_ascii=False, indent=4)
+            self.file.write(("," if self.count else "") + "\n    " + text.replace("\n", "\n    "))
+        self.count += 1
+
+    def close(self):
+        if not self.jsonl:
+            self.file.write("\n]" if self.count else "]")
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+        self.finished = True
+
+    def abort(self):
+        """丢弃临时文件；已经 close() 或 abort() 过时什么也不做。"""
+        if self.finished:
+            return
+        self.finished = True
+        self.file.close()
+        os.remove(self.tmp_path)
+
+
+class OrderedWriter:
+    """
+    按位置顺序写出乱序完成的结果：先完成的后续条目暂存，前面的条目到齐后立即写出。
+    指定 load 时暂存的只是轻量的引用（如 idx），写出时才调用 load 取出完整结果。
+    """
+
+    def __init__(self, writer, load=None):
+        self.writer = writer
+        self.load = load
+        self.next_pos = 0
+        self.pending = {}
+
+    def add(self, pos, value):
+        self.pending[pos] = value
+        while self.next_pos in self.pending:
+            value = self.pending.pop(self.next_pos)
+            self.writer.write(self.load(value) if self.load else value)
+            self.next_pos += 1
+
+    def close(self):
+        if self.pending:
+            raise RuntimeError(f"{self.writer.path}: {len(self.pending)} results missing before position {min(self.pending)}")
+        self.writer.close()
+
+    def abort(self):
+        self.pending.clear()
+        self.writer.abort()
@@ -0,0 +1,74 @@
+import hashlib
+import json
+
+# ========================== 重复任务合并 ==========================
+class DedupPlan:
+    """
+    同一模型下 (prompt, 图片内容) 完全相同的任务只请求一次。
+
+    规划阶段按数据文件顺序登记所有任务，每组重复任务中第一个出现的为 leader，
+    其余为 follower；运行时只提交 leader，leader 完成后把结果分发给各个 follower。
+    内存中只保存任务指纹与 follower 的对应关系。
+    """
+
+    def __init__(self):
+        self.first = {}
+        self.followers = {}
+        self.leaders = set()
+        self.waiting = {}
+        self.completed = {}
+        self.total = {}
+        self.unique = {}
+
+    @staticmethod
+    def fingerprint(model_key, prompt, image_id):
+        payload = json.dumps([model_key, prompt, image_id], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).digest()
+
+    def add(self, model_key, task, prompt, image_id):
+        """登记一个任务，task 为 (model, dataset, idx)。"""
+        fingerprint = self.fingerprint(model_key, prompt, image_id)
+        self.total[model_key] = self.total.get(model_key, 0) + 1
+        leader = self.first.setdefault(fingerprint, task)
+        if leader == task:
+            self.unique[model_key] = self.unique.get(model_key, 0) + 1
+        else:
+            self.followers[task] = leader
+
+    def finish_planning(self):
+        """规划结束后释放指纹表，只保留 follower -> leader 的对应关系。"""
+        self.first = {}
+        self.leaders = set(self.followers.values())
+
+    def leader_of(self, task):
+        """task 为 follower 时返回其 leader，否则返回 None。"""
+        return self.followers.get(task)
+
+    def wait(self, leader, callback):
+        """leader 完成后调用 callback(leader 的结果)；已完成时立即调用。"""
+        if leader in self.completed:
+            callback(self.completed[leader]())
+        else:
+            self.waiting.setdefault(leader, []).append(callback)
+
+    def complete(self, task, load):
+        """
+        标记任务已完成；若它是某组重复任务的 leader，通知等待中的 follower。
+        load 为取出其结果的函数（从断点读取），只在有 follower 时调用。
+        """
+        if task not in self.leaders:
+            return
+        leader = task
+        self.completed[leader] = load
+        callbacks = self.waiting.pop(leader, [])
+        if callbacks:
+            result = load()
+            for callback in callbacks:
+                callback(result)
+
+    def report(self):
+        lines = []
+        for model_key, total in self.total.items():
+            saved = total - self.unique.get(model_key, 0)
+            lines.append(f"{model_key}: {total} tasks, {saved} duplicates answered from a single request ({saved / total:.1%} saved)")
+        return "\n".join(lines)
@@ -0,0 +1,159 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+_TASK = threading.local()
+
+def queue_wait():
+    """当前任务从提交到开始执行所等待的秒数（在 worker 内调用）。"""
+    return getattr(_TASK, 'queue_wait', None)
+
+def _run_task(worker, item, submitted):
+    _TASK.queue_wait = time.monotonic() - submitted
+    return worker(item)
+
+# ========================== 全局调度器 ==========================
+class Scheduler:
+    """
+    在同一进程内并发执行所有 (模型, 数据集, 条目) 任务。
+
+    每个模型拥有独立的线程池作为并发预算，因此 o1、qvq-max 这类慢模型
+    只会占用自己的并发额度，不会拖慢 Gemini Flash 等快模型。
+    每个模型一条进度条，集中显示进度与 ETA。
+
+    条目按需从 items 中取出提交，每个模型同时提交的条目数不超过并发数的 SUBMIT_FACTOR 倍，
+    因此 items 可以是惰性的生成器，内存占用与数据集大小无关。
+    """
+
+    SUBMIT_FACTOR = 2
+
+    def __init__(self, concurrency, default_concurrency=1):
+        # concurrency: {model_key: 该模型同时在途的最大请求数}
+        self.concurrency = dict(concurrency)
+        self.default_concurrency = default_concurrency
+        self.jobs = []
+        # run() 结束后记录每个模型全部任务完成所用的秒数
+        self.elapsed = {}
+
+    def add_job(self, model_key, name, items, worker, on_done=None, on_result=None, total=None):
+        """
+        注册一个 (模型, 数据集) 任务组。
+
+        :param model_key: 模型键，决定使用哪个并发预算
+        :param name:      任务组名称（通常为数据文件名）
+        :param items:     待处理条目的可迭代对象，在主线程中按需迭代
+        :param worker:    处理单个条目的函数
+        :param on_done:   该任务组全部完成后调用，参数为按原顺序排列的结果列表（设置了 on_result 时为 None）
+        :param on_result: 每个条目完成后在主线程中调用 on_result(位置, 结果)；设置后不再在内存中保留结果
+        :param total:     条目总数，items 没有长度时用于进度条
+        """
+        if total is None and hasattr(items, '__len__'):
+            total = len(items)
+        self.jobs.append({
+            "model_key": model_key,
+            "name": name,
+            "items": iter(items),
+            "worker": worker,
+            "on_done": on_done,
+            "on_result": on_result,
+            "total": total,
+            "results": None if on_result else [],
+            "submitted": 0,
+            "completed": 0,
+            "exhausted": False,
+            "finished": False,
+        })
+
+    def _model_keys(self):
+        keys = []
+        for job in self.jobs:
+            if job["model_key"] not in keys:
+                keys.append(job["model_key"])
+        return keys
+
+    def _finish(self, job):
+        if job["finished"] or not job["exhausted"] or job["completed"] < job["submitted"]:
+            return False
+        job["finished"] = True
+        if job["on_done"]:
+            job["on_done"](job["results"])
+        return True
+
+    def run(self):
+        import tqdm
+
+        model_keys = self._model_keys()
+        limits = {key: max(1, self.concurrency.get(key, self.default_concurrency)) for key in model_keys}
+        executors = {key: ThreadPoolExecutor(max_workers=limits[key]) for key in model_keys}
+        totals = {}
+        for job in self.jobs:
+            key = job["model_key"]
+            totals[key] = None if job["total"] is None or totals.get(key, 0) is None else totals.get(key, 0) + job["total"]
+        bars = {
+            key: tqdm.tqdm(total=totals[key], desc=key, position=pos)
+            for pos, key in enumerate(model_keys)
+        }
+        started = time.time()
+        finished_at = {}
+        futures = {}
+        in_flight = dict.fromkeys(model_keys, 0)
+
+        def model_done(key):
+            if all(job["finished"] for job in self.jobs if job["model_key"] == key):
+                finished_at.setdefault(key, time.time() - started)
+
+        def submit_more(key):
+            window = limits[key] * self.SUBMIT_FACTOR
+            for job in self.jobs:
+                if job["model_key"] != key or job["exhausted"]:
+                    continue
+                while in_flight[key] < window:
+                    try:
+                        item = next(job["items"])
+                    except StopIteration:
+                        job["exhausted"] = True
+                        if self._finish(job):
+                            model_done(key)
+                        break
+                    pos = job["submitted"]
+                    job["submitted"] += 1
+                    if job["results"] is not None:
+                        job["results"].append(None)
+                    future = executors[key].submit(_run_task, job["worker"], item, time.monotonic())
+                    futures[future] = (job, pos)
+                    in_flight[key] += 1
+                if in_flight[key] >= window:
+                    return
+
+        try:
+            for key in model_keys:
+                submit_more(key)
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, pos = futures.pop(future)
+                    key = job["model_key"]
+                    in_flight[key] -= 1
+                    result = future.result()
+                    if job["on_result"]:
+                        job["on_result"](pos, result)
+                    else:
+                        job["results"][pos] = result
+                    job["completed"] += 1
+                    bars[key].update(1)
+                    if self._finish(job):
+                        model_done(key)
+                    submit_more(key)
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True, cancel_futures=True)
+            for bar in bars.values():
+                bar.close()
+
+        self.elapsed = dict(finished_at)
+        for key in model_keys:
+            if key in finished_at:
+                print(f"{key}: {bars[key].n} items in {finished_at[key]:.1f}s")
+
+        return [job["results"] for job in self.jobs]
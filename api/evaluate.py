@@ -0,0 +1,294 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import unicodedata
+from collections import Counter
+from pathlib import Path
+
+from metrics import parse_result_name, run_label
+
+# ========================== 路径配置 ==========================
+# 逐条目评分记录，后续评测只对新增或变化的结果重新打分
+DEFAULT_STORE_PATH = '/mnt/workspace/xintong/lyx/results/AmbiTrans_api/cache/scores.sqlite'
+
+# 评分方法（分词、n 阶数、义项匹配规则）变化时递增，使已保存的统计量失效
+SCORER_VERSION = 1
+
+# ========================== 文本处理 ==========================
+BLEU_ORDER = 4
+CHRF_ORDER = 6
+CHRF_BETA = 2
+
+def answer_text(result):
+    """结果可能是字符串，也可能是流式模型的 {"reasoning", "answer"}。"""
+    if isinstance(result, dict):
+        result = result.get("answer") or ""
+    return result or ""
+
+def normalize(text):
+    """字符级评测：去掉所有空白字符。"""
+    return "".join(text.split())
+
+def strip_punctuation(text):
+    return "".join(ch for ch in normalize(text) if not unicodedata.category(ch).startswith('P'))
+
+def char_ngrams(text, max_order):
+    """返回 [Counter(1-gram), ..., Counter(max_order-gram)]。"""
+    return [Counter(text[i:i + n] for i in range(len(text) - n + 1)) for n in range(1, max_order + 1)]
+
+# 义项标注中的补充说明与并列写法，如 "事工（宗教组织或活动）"、"乐器或风笛"
+_PARENTHESES = re.compile(r'（[^）]*）|\([^)]*\)')
+_ALTERNATIVES = re.compile(r'或|/|／|;|；')
+
+def interpretation_variants(gold):
+    """gold_interpretation 的可接受写法：去掉括号说明后的整体，以及按"或"等拆开的各个候选。"""
+    base = strip_punctuation(_PARENTHESES.sub('', gold))
+    variants = {base} | {strip_punctuation(part) for part in _ALTERNATIVES.split(_PARENTHESES.sub('', gold))}
+    return [v for v in variants if v] or [strip_punctuation(gold)]
+
+# ========================== 参考译文 ==========================
+class Reference:
+    """单个条目的参考信息：standard_zh 的字符 n-gram 计数与 sense 的候选写法，每个数据集只计算一次。"""
+
+    __slots__ = ('length', 'ngrams', 'senses')
+
+    def __init__(self, item):
+        text = normalize(item.get("standard_zh") or "")
+        self.length = len(text)
+        self.ngrams = char_ngrams(text, CHRF_ORDER)
+        self.senses = [
+            (interpretation_variants(sense["gold_interpretation"]), Counter(strip_punctuation(sense["gold_interpretation"])))
+            for sense in item.get("sense") or []
+            if sense.get("gold_interpretation")
+        ]
+
+# ========================== 充分统计量 ==========================
+def item_stats(hypothesis, reference):
+    """
+    计算单个条目的充分统计量，语料级分数由各条目的统计量直接相加得到：
+      bleu:  [1..4-gram 匹配数, 1..4-gram 总数, 译文长度, 参考长度]
+      chrf:  [1..6-gram 的 (译文计数, 参考计数, 匹配数)]
+      sense: [命中的义项数, 义项总数, 义项字符召回之和]
+    """
+    text = normalize(hypothesis)
+    hyp_ngrams = char_ngrams(text, CHRF_ORDER)
+
+    matches = [sum((hyp_ngrams[n] & reference.ngrams[n]).values()) for n in range(CHRF_ORDER)]
+    hyp_totals = [max(0, len(text) - n) for n in range(CHRF_ORDER)]
+    ref_totals = [max(0, reference.length - n) for n in range(CHRF_ORDER)]
+
+    bleu = matches[:BLEU_ORDER] + hyp_totals[:BLEU_ORDER] + [len(text), reference.length]
+    chrf = [value for n in range(CHRF_ORDER) for value in (hyp_totals[n], ref_totals[n], matches[n])]
+
+    plain = strip_punctuation(hypothesis)
+    plain_chars = Counter(plain)
+    hits = 0
+    recall = 0.0
+    for variants, gold_chars in reference.senses:
+        if any(variant in plain for variant in variants):
+            hits += 1
+        if gold_chars:
+            recall += sum((plain_chars & gold_chars).values()) / sum(gold_chars.values())
+    return {"bleu": bleu, "chrf": chrf, "sense": [hits, len(reference.senses), recall]}
+
+def add_stats(total, stats):
+    for key, values in stats.items():
+        if key not in total:
+            total[key] = [0] * len(values)
+        total[key] = [a + b for a, b in zip(total[key], values)]
+    return total
+
+# ========================== 评分记录 ==========================
+def item_hash(answer, item):
+    """评分记录键中的结果哈希：译文、参考译文、义项标注与评分方法版本都不变时才复用统计量。"""
+    payload = json.dumps(
+        [SCORER_VERSION, answer, item.get("standard_zh"), item.get("sense")],
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ScoreStore:
+    """
+    基于 SQLite 的逐条目评分记录，主键为 (model, dataset, idx, 结果哈希)，值为充分统计量。
+    同一模型不同运行的结果各自保存，交替评测多次运行时互不覆盖，结果相同的条目直接复用统计量。
+    """
+
+    def __init__(self, path):
+        Path(os.path.dirname(path) or '.').mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # 旧版本的记录以 (model, dataset, idx) 为主键，每个条目只能保存一份结果，直接丢弃
+        self.conn.execute("DROP TABLE IF EXISTS scores")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS item_scores ("
+            "model TEXT NOT NULL, dataset TEXT NOT NULL, idx TEXT NOT NULL, result_hash TEXT NOT NULL, "
+            "stats TEXT NOT NULL, PRIMARY KEY (model, dataset, idx, result_hash))"
+        )
+        self.conn.commit()
+
+    def load(self, model, dataset):
+        """返回 {(idx, result_hash): stats}。idx 以 JSON 形式保存，保留原始类型。"""
+        rows = self.conn.execute(
+            "SELECT idx, result_hash, stats FROM item_scores WHERE model = ? AND dataset = ?", (model, dataset)
+        ).fetchall()
+        return {(json.loads(idx), result_hash): json.loads(stats) for idx, result_hash, stats in rows}
+
+    def save(self, model, dataset, records):
+        """records: [(idx, result_hash, stats), ...]"""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO item_scores (model, dataset, idx, result_hash, stats) VALUES (?, ?, ?, ?, ?)",
+            [(model, dataset, json.dumps(idx), result_hash, json.dumps(stats)) for idx, result_hash, stats in records]
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+# ========================== 语料级分数 ==========================
+def corpus_bleu(stats):
+    matches = stats[:BLEU_ORDER]
+    totals = stats[BLEU_ORDER:2 * BLEU_ORDER]
+    hyp_len, ref_len = stats[2 * BLEU_ORDER:]
+    if hyp_len == 0 or min(matches) == 0:
+        return 0.0
+    log_precision = sum(math.log(m / t) for m, t in zip(matches, totals)) / BLEU_ORDER
+    brevity = 1.0 if hyp_len > ref_len else math.exp(1 - ref_len / hyp_len)
+    return 100 * brevity * math.exp(log_precision)
+
+def corpus_chrf(stats, beta=CHRF_BETA):
+    precisions = []
+    recalls = []
+    for n in range(CHRF_ORDER):
+        hyp_total, ref_total, match = stats[3 * n:3 * n + 3]
+        if hyp_total and ref_total:
+            precisions.append(match / hyp_total)
+            recalls.append(match / ref_total)
+    if not precisions:
+        return 0.0
+    precision = sum(precisions) / len(precisions)
+    recall = sum(recalls) / len(recalls)
+    if precision + recall == 0:
+        return 0.0
+    return 100 * (1 + beta ** 2) * precision * recall / (beta ** 2 * precision + recall)
+
+def corpus_scores(total, items=0, errors=0):
+    hits, senses, recall = total.get("sense", [0, 0, 0.0])
+    return {
+        "items": items,
+        "errors": errors,
+        "bleu": corpus_bleu(total["bleu"]) if "bleu" in total else 0.0,
+        "chrf": corpus_chrf(total["chrf"]) if "chrf" in total else 0.0,
+        "sense_hit_rate": hits / senses if senses else None,
+        "sense_char_recall": recall / senses if senses else None,
+    }
+
+# ========================== 评测 ==========================
+def evaluate_results(results_by_key, store=None):
+    """
+    :param results_by_key: {(model, run, dataset): 条目列表或迭代器}，条目中带有 standard_zh 与 sense；
+                           run 为 None 时不区分运行
+    :param store:          可选 ScoreStore，结果未变化的条目直接复用已保存的统计量（不同运行共用）
+    :return:               {"by_dataset": {"model-run / dataset": 分数}, "by_model": {"model-run": 分数},
+                            "rescored": 本次重新打分的条目数}
+
+    参考译文的 n-gram 计数每个数据集只计算一次（且只为需要打分的条目计算），所有模型共用；
+    只出现一次的数据集不保留参考译文，逐条流式评测时内存占用与数据集大小无关。
+    """
+    shared = Counter(dataset for _, _, dataset in results_by_key)
+    references = {}
+    by_dataset = {}
+    model_totals = {}
+    rescored = 0
+    for (model, run, dataset), items in results_by_key.items():
+        label = run_label(model, run)
+        refs = references.setdefault(dataset, {}) if shared[dataset] > 1 else {}
+        stored = store.load(model, dataset) if store else {}
+
+        total = {}
+        count = 0
+        errors = 0
+        updates = []
+        for item in items:
+            count += 1
+            if item.get("error"):
+                errors += 1
+            answer = answer_text(item.get("result"))
+            result_hash = item_hash(answer, item)
+            stats = stored.get((item["idx"], result_hash))
+            if stats is None:
+                reference = refs.get(item["idx"]) or Reference(item)
+                if shared[dataset] > 1:
+                    refs[item["idx"]] = reference
+                stats = item_stats(answer, reference)
+                updates.append((item["idx"], result_hash, stats))
+            add_stats(total, stats)
+        if store and updates:
+            store.save(model, dataset, updates)
+        rescored += len(updates)
+        by_dataset[f"{label} / {dataset}"] = corpus_scores(total, count, errors)
+
+        model_total = model_totals.setdefault(label, {"total": {}, "items": 0, "errors": 0})
+        add_stats(model_total["total"], total)
+        model_total["items"] += count
+        model_total["errors"] += errors
+
+    return {
+        "by_dataset": by_dataset,
+        "by_model": {
+            model: corpus_scores(value["total"], value["items"], value["errors"])
+            for model, value in model_totals.items()
+        },
+        "rescored": rescored,
+    }
+
+def format_scores(scores):
+    lines = [f"{'':<48} {'items':>6} {'errors':>6} {'BLEU':>6} {'chrF':>6} {'sense hit':>9} {'sense recall':>12}"]
+    for section in ('by_model', 'by_dataset'):
+        for name, s in scores[section].items():
+            hit = f"{s['sense_hit_rate'] * 100:.1f}" if s['sense_hit_rate'] is not None else '-'
+            recall = f"{s['sense_char_recall'] * 100:.1f}" if s['sense_char_recall'] is not None else '-'
+            lines.append(
+                f"{name:<48} {s['items']:>6} {s['errors']:>6} {s['bleu']:>6.2f} {s['chrf']:>6.2f} {hit:>9} {recall:>12}"
+            )
+    return "\n".join(lines)
+
+def load_results(paths):
+    results_by_key = {}
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            results_by_key.setdefault(parse_result_name(path), []).extend(json.load(f))
+    return results_by_key
+
+# ========================== 主函数 ==========================
+def main():
+    parser = argparse.ArgumentParser(description="Score result files with character-level BLEU/chrF against standard_zh and sense hit rates")
+    parser.add_argument('files', nargs='+', help="Result files named {model}-{run_id}_{dataset}.json; each run is scored separately")
+    parser.add_argument('--json', type=str, default=None, help="Also write the scores to this JSON file")
+    parser.add_argument('--store', type=str, default=DEFAULT_STORE_PATH,
+                        help="SQLite file with per-item score records; only new or changed results are rescored")
+    parser.add_argument('--no-store', action='store_true', help="Score every item from scratch without reading or writing the store")
+    args = parser.parse_args()
+
+    results_by_key = load_results(args.files)
+    store = None if args.no_store else ScoreStore(args.store)
+    try:
+        scores = evaluate_results(results_by_key, store)
+    finally:
+        if store:
+            store.close()
+    total = sum(len(items) for items in results_by_key.values())
+    print(f"Rescored {scores['rescored']} of {total} items")
+    print(format_scores(scores))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(scores, f, ensure_ascii=False, indent=4)
+
+if __name__ == "__main__":
+    main()
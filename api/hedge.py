@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+from metrics import percentile
+
+# ========================== 对冲请求 ==========================
+# 计算延迟百分位所用的最近成功请求数，以及开始对冲前至少需要的样本数
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+
+class DeadlineExceeded(Exception):
+    """请求超过硬性截止时间，在途请求已全部取消（不重试）。"""
+
+
+class RequestCancelled(Exception):
+    """请求已被取消（对冲中另一份请求先返回，或超过截止时间）。"""
+
+
+class HedgeStats:
+    """
+    单个模型的对冲统计：最近成功请求的延迟（用于计算对冲阈值），
+    以及对冲次数、对冲获胜次数、超时次数和对冲额外消耗的 token 数。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=HEDGE_WINDOW)
+        self.counts = {
+            "requests": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "deadline_exceeded": 0,
+            "extra_prompt_tokens": 0,
+            "extra_completion_tokens": 0,
+        }
+
+    def record_latency(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def threshold(self, q):
+        """最近请求延迟的第 q 百分位；样本不足时返回 None（不对冲）。"""
+        with self.lock:
+            if len(self.latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            values = sorted(self.latencies)
+        return percentile(values, q)
+
+    def add(self, **counts):
+        with self.lock:
+            for key, value in counts.items():
+                self.counts[key] += value or 0
+
+    def report(self):
+        with self.lock:
+            c = dict(self.counts)
+        extra = c["extra_prompt_tokens"] + c["extra_completion_tokens"]
+        return (f"{c['hedged']} of {c['requests']} requests hedged ({c['hedge_wins']} won by the hedge), "
+                f"{c['deadline_exceeded']} past deadline, ~{extra} extra tokens "
+                f"({c['extra_prompt_tokens']} prompt + {c['extra_completion_tokens']} completion)")
+
+
+_STATS = {}
+_STATS_LOCK = threading.Lock()
+
+def get_hedge_stats(model_key):
+    with _STATS_LOCK:
+        return _STATS.setdefault(model_key, HedgeStats())
+
+def hedge_reports():
+    """{model_key: 统计说明}，只包含发生过对冲或超时的模型。"""
+    with _STATS_LOCK:
+        stats = dict(_STATS)
+    return {key: s.report() for key, s in stats.items() if s.counts["hedged"] or s.counts["deadline_exceeded"]}
+
+def _start(call, cancel, metrics):
+    """在独立的守护线程中执行 call(cancel, metrics)，被放弃的请求不会占用调度器的线程。"""
+    future = Future()
+    future.started = time.monotonic()
+    future.metrics = metrics
+
+    def run():
+        try:
+            future.set_result(call(cancel, metrics))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+def hedged_call(call, metrics, stats, hedge_percentile=None, deadline=None, before_hedge=None, on_abandoned=None):
+    """
+    带对冲与硬性截止时间的请求。
+
+    先发送一份请求；超过该模型最近延迟的第 hedge_percentile 百分位仍未返回时再发送一份，
+    先成功返回的结果胜出，另一份通过 cancel 事件取消（流式请求随即关闭连接，服务端停止生成；
+    非流式请求无法中途取消，结果到达后丢弃）。超过 deadline 秒仍没有结果时取消全部请求并抛出 DeadlineExceeded。
+
+    :param call:       call(cancel, metrics)，cancel 为 threading.Event，metrics 为该份请求自己的计时字典
+    :param metrics:    条目的 metrics，写入胜出请求的计时以及 hedged / hedge_won
+    :param stats:      该模型的 HedgeStats
+    :param before_hedge: 发送对冲请求前调用（如向限流器申请额度）
+    :param on_abandoned: 未计入 metrics 的每份请求（对冲中的落后者、超时被取消的请求、同时失败的其余请求）
+                         结束后以其 metrics 调用，用于按其消耗的 token 计费
+    """
+    started = time.monotonic()
+    end = started + deadline if deadline else None
+    cancel = threading.Event()
+    attempts = [_start(call, cancel, {})]
+    stats.add(requests=1)
+
+    threshold = stats.threshold(hedge_percentile) if hedge_percentile else None
+    errors = []
+    while True:
+        pending = [f for f in attempts if not f.done()]
+        timeout = None
+        if len(attempts) == 1 and threshold is not None:
+            timeout = max(0.0, started + threshold - time.monotonic())
+        if end is not None:
+            remaining = max(0.0, end - time.monotonic())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        if pending:
+            wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+        for future in attempts:
+            if future.done() and future not in errors:
+                if future.exception() is None:
+                    return _finish(future, attempts, cancel, metrics, stats, on_abandoned)
+                errors.append(future)
+        if len(errors) == len(attempts):
+            # 已发送的请求全部失败时不再对冲，把第一个异常交给 call_with_retry 按错误类型处理
+            cancel.set()
+            metrics.update(errors[0].metrics)
+            if on_abandoned:
+                for future in errors[1:]:
+                    on_abandoned(future.metrics)
+            raise errors[0].exception()
+
+        now = time.monotonic()
+        if end is not None and now >= end:
+            cancel.set()
+            stats.add(deadline_exceeded=1)
+            metrics['hedged'] = len(attempts) > 1
+            if on_abandoned:
+                for future in attempts:
+                    future.add_done_callback(lambda f: on_abandoned(f.metrics))
+            raise DeadlineExceeded(f"no response within {deadline}s, request cancelled")
+        if len(attempts) == 1 and threshold is not None and now >= started + threshold:
+            if before_hedge:
+                before_hedge()
+            attempts.append(_start(call, cancel, {}))
+            stats.add(hedged=1)
+
+def _finish(winner, attempts, cancel, metrics, stats, on_abandoned=None):
+    """记录胜出请求的计时，取消其余请求，并在其结束后把它们消耗的 token 记为对冲的额外开销。"""
+    cancel.set()
+    stats.record_latency(time.monotonic() - winner.started)
+    metrics.update(winner.metrics)
+    if len(attempts) > 1:
+        metrics['hedged'] = True
+        metrics['hedge_won'] = winner is attempts[1]
+        if winner is attempts[1]:
+            stats.add(hedge_wins=1)
+    for loser in attempts:
+        if loser is not winner:
+            loser.add_done_callback(lambda f: stats.add(
+                extra_prompt_tokens=f.metrics.get('prompt_tokens') or metrics.get('prompt_tokens'),
+                extra_completion_tokens=f.metrics.get('completion_tokens')
+            ))
+            if on_abandoned:
+                loser.add_done_callback(lambda f: on_abandoned(f.metrics))
+    return winner.result()
@@ -0,0 +1,282 @@
+import argparse
+import base64
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+from pathlib import Path
+
+# ========================== 路径配置 ==========================
+# 预处理后图片 payload 的持久化缓存目录
+DEFAULT_CACHE_DIR = '/mnt/workspace/xintong/lyx/results/AmbiTrans_api/cache/images'
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif')
+
+# ========================== 图片编码 ==========================
+def _encode_raw(image_path):
+    with open(image_path, "rb") as image_file:
+        return base64.b64encode(image_file.read()).decode("utf-8")
+
+def _jpeg_base64(img, quality):
+    buffer = BytesIO()
+    img.save(buffer, format='JPEG', quality=quality)
+    return base64.b64encode(buffer.getvalue())
+
+def _resize(img, scale_factor):
+    from PIL import Image
+
+    width, height = img.size
+    new_width = max(1, int(width * scale_factor))
+    new_height = max(1, int(height * scale_factor))
+    return img.resize((new_width, new_height), resample=Image.LANCZOS)
+
+def _compress_image_to_base64(
+    image_path,
+    max_width=8000,
+    max_height=8000,
+    max_size_bytes=5 * 1024 * 1024,  # 5 MB
+    quality=85,
+    min_quality=20
+):
+    """
+    将图片压缩到指定大小以下并转为 base64 编码字符串。
+    这里的大小判断针对『Base64 后的字节数』，返回结果一定不超过 max_size_bytes。
+
+    策略：
+    1) 先以 quality 编码一次，满足限制直接返回；
+    2) 否则以 min_quality 编码，若仍超限，根据每像素字节数估计目标分辨率并一次性缩放；
+    3) 在 [min_quality, quality] 之间二分查找满足限制的最高质量。
+
+    :param image_path: 原始图片的文件路径
+    :param max_width:  最大宽度（像素）
+    :param max_height: 最大高度（像素）
+    :param max_size_bytes: 最终 base64 字符串的最大字节限制
+    :param quality:   JPEG 初始压缩质量（1~95之间）
+    :param min_quality: 降低质量的下限，低于该质量时改为缩小分辨率
+    :return:          压缩后图片的 base64 编码字符串
+    """
+    # PIL 只在真正需要压缩图片时导入，raw 策略与只读缓存的运行不加载它
+    from PIL import Image
+
+    passes = 0
+    with Image.open(image_path) as img:
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+
+        # -------- 1) 等比例缩放到不超过最大宽高 --------
+        width, height = img.size
+        scale_factor = min(max_width / width, max_height / height, 1.0)
+        if scale_factor < 1.0:
+            img = _resize(img, scale_factor)
+
+        # -------- 2) 初始质量直接满足限制 --------
+        b64_data = _jpeg_base64(img, quality)
+        passes += 1
+        best = (quality, b64_data) if len(b64_data) <= max_size_bytes else None
+
+        if best is None:
+            # -------- 3) 最低质量仍超限：按像素数估计目标分辨率后缩放 --------
+            low_data = _jpeg_base64(img, min_quality)
+            passes += 1
+            while len(low_data) > max_size_bytes:
+                # JPEG 大小与像素数近似成正比，留 10% 余量一次缩放到位
+                img = _resize(img, min(0.9, (max_size_bytes / len(low_data)) ** 0.5 * 0.9))
+                low_data = _jpeg_base64(img, min_quality)
+                passes += 1
+            best = (min_quality, low_data)
+
+            # -------- 4) 二分查找满足限制的最高质量 --------
+            lo, hi = min_quality, quality
+            while hi - lo > 5:
+                mid = (lo + hi) // 2
+                mid_data = _jpeg_base64(img, mid)
+                passes += 1
+                if len(mid_data) <= max_size_bytes:
+                    lo = mid
+                    best = (mid, mid_data)
+                else:
+                    hi = mid
+
+        final_quality, b64_data = best
+        print(
+            f"Compressed {os.path.basename(image_path)}: {img.size[0]}x{img.size[1]}, "
+            f"quality {final_quality}, size {len(b64_data)}, {passes} encode passes"
+        )
+
+    return b64_data.decode('utf-8')
+
+ENCODERS = {
+    'raw': _encode_raw,
+    'compress': _compress_image_to_base64,
+}
+
+# 编码算法变化时递增版本号，使旧的磁盘缓存失效
+ENCODER_VERSIONS = {
+    'raw': 1,
+    'compress': 2,
+}
+
+# ========================== payload 缓存 ==========================
+_CACHE_DIR = None
+# 实际编码（缓存未命中）的次数与消耗的 CPU 时间，用于基准测试
+_ENCODE_STATS = {"encodes": 0, "cpu_seconds": 0.0}
+_STATS_LOCK = threading.Lock()
+
+def configure(cache_dir=DEFAULT_CACHE_DIR):
+    """设置持久化缓存目录，传入 None 时只使用进程内缓存。"""
+    global _CACHE_DIR
+    _CACHE_DIR = cache_dir
+    if cache_dir:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+
+def payload_key(image_path, policy, **params):
+    """缓存键：(图片绝对路径, mtime, 预处理策略及其参数，如最大字节数与最大宽高)。"""
+    stat = os.stat(image_path)
+    key = json.dumps(
+        {
+            "path": os.path.abspath(image_path),
+            "mtime": stat.st_mtime_ns,
+            "policy": policy,
+            "version": ENCODER_VERSIONS[policy],
+            "params": params,
+        },
+        sort_keys=True
+    )
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+@functools.lru_cache(maxsize=64)
+def _load_payload(key, image_path, policy, params, cache_dir):
+    params = dict(params)
+    cache_file = os.path.join(cache_dir, key[:2], f"{key}.b64") if cache_dir else None
+    if cache_file and os.path.exists(cache_file):
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    cpu_started = time.thread_time()
+    payload = ENCODERS[policy](image_path, **params)
+    with _STATS_LOCK:
+        _ENCODE_STATS["encodes"] += 1
+        _ENCODE_STATS["cpu_seconds"] += time.thread_time() - cpu_started
+
+    if cache_file:
+        Path(os.path.dirname(cache_file)).mkdir(parents=True, exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(tmp_file, cache_file)
+    return payload
+
+def encode_stats(reset=False):
+    """返回 {"encodes", "cpu_seconds"}；reset 为 True 时同时清零计数并清空进程内缓存。"""
+    with _STATS_LOCK:
+        stats = dict(_ENCODE_STATS)
+        if reset:
+            _ENCODE_STATS.update(encodes=0, cpu_seconds=0.0)
+    if reset:
+        _load_payload.cache_clear()
+    return stats
+
+def get_payload(image_path, policy='raw', **params):
+    """
+    返回图片预处理后的 base64 字符串。
+
+    先查进程内 LRU，再查磁盘缓存，都未命中时才真正读取并编码图片，
+    因此同一张图片在不同模型、不同重试之间只编码一次。
+    """
+    key = payload_key(image_path, policy, **params)
+    return _load_payload(key, image_path, policy, tuple(sorted(params.items())), _CACHE_DIR)
+
+def encode_image(image_path):
+    return get_payload(image_path, 'raw')
+
+def encode_and_compress_image_to_base64(
+    image_path,
+    max_width=8000,
+    max_height=8000,
+    max_size_bytes=5 * 1024 * 1024,  # 5 MB
+    quality=85
+):
+    return get_payload(
+        image_path,
+        'compress',
+        max_width=max_width,
+        max_height=max_height,
+        max_size_bytes=max_size_bytes,
+        quality=quality
+    )
+
+def encode_with_policy(image_path, policy='raw'):
+    """按模型配置中的 image_policy 返回图片 payload。"""
+    if policy == 'compress':
+        return encode_and_compress_image_to_base64(image_path)
+    return encode_image(image_path)
+
+# ========================== 预计算 ==========================
+def _precompute_one(image_path, policies, cache_dir):
+    configure(cache_dir)
+    for policy in policies:
+        encode_with_policy(image_path, policy)
+    return image_path
+
+def precompute(folders, policies=('raw', 'compress'), cache_dir=DEFAULT_CACHE_DIR, workers=None):
+    """
+    多进程并行地为 folders 下的所有图片生成 payload 并写入磁盘缓存。
+
+    :return: (成功数量, 失败列表)
+    """
+    image_paths = []
+    for folder in folders:
+        for root, _, files in os.walk(folder):
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    image_paths.append(os.path.join(root, name))
+
+    print(f"Precomputing {len(image_paths)} images with policies {list(policies)} into {cache_dir}")
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+
+    done = 0
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_precompute_one, path, tuple(policies), cache_dir): path
+            for path in image_paths
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+                done += 1
+            except Exception as e:
+                failed.append((futures[future], str(e)))
+                print(f"Failed on {futures[future]}: {e}")
+
+    print(f"Precomputed {done} images, {len(failed)} failed")
+    return done, failed
+
+# ========================== 主函数 ==========================
+def main():
+    parser = argparse.ArgumentParser(description="Image payload preprocessing")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    precompute_parser = subparsers.add_parser('precompute', help="Build cached payloads for image folders")
+    precompute_parser.add_argument('folders', nargs='+', help="Image folders, e.g. the 3am and MMA image folders")
+    precompute_parser.add_argument(
+        '--policy',
+        nargs='+',
+        choices=list(ENCODERS),
+        default=list(ENCODERS),
+        help="Preprocessing policies to build: raw (plain base64) and/or compress (Claude size-limited JPEG)"
+    )
+    precompute_parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="Payload cache directory")
+    precompute_parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+
+    args = parser.parse_args()
+
+    if args.command == 'precompute':
+        precompute(args.folders, args.policy, args.cache_dir, args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+import argparse
+import datetime
+import glob
+import hashlib
+import json
+import os
+import secrets
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+from dataio import iter_items
+from evaluate import evaluate_results
+from metrics import histogram, summarize
+from postprocess import error_class
+from shard import shard_suffix
+
+# ========================== 路径配置 ==========================
+# 每次运行的清单文件 {run_id}.json，分片运行为 {run_id}.shard-{i}-of-{N}.json
+DEFAULT_RUNS_DIR = '/mnt/workspace/xintong/lyx/results/AmbiTrans_api/runs'
+
+USAGE_FIELDS = ('prompt_tokens', 'completion_tokens', 'reasoning_tokens')
+# 合并多份清单时直接相加的计数
+COUNT_FIELDS = ('requests', 'processed', 'retries', 'cached')
+# 取自结果文件的字段，合并时以最后一份带结果文件的清单为准
+OUTPUT_FIELDS = ('output', 'items', 'errors', 'error_classes', 'quality')
+QUALITY_FIELDS = ('bleu', 'chrf', 'sense_hit_rate', 'sense_char_recall')
+
+# ========================== 运行标识 ==========================
+def new_run_id(now=None):
+    """{日期}-{时分秒}-{4 位随机十六进制}，同一天的多次运行不会覆盖彼此的结果文件。"""
+    now = now or datetime.datetime.now()
+    return f"{now:%Y-%m-%d-%H%M%S}-{secrets.token_hex(2)}"
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+# ========================== 运行清单 ==========================
+class RunManifest:
+    """
+    记录一次运行的配置（命令行、各模型的注册表配置与模型名、prompt 与数据文件哈希），
+    以及本次实际发送的请求的耗时分布、延迟直方图、token 用量、重试次数、错误分类和结果质量，
+    写入 runs/{run_id}.json（分片运行带分片后缀），供 compare 对比多次运行。
+    """
+
+    def __init__(self, run_id, options=None, shard=None):
+        self.started = time.monotonic()
+        # 本次运行各模型的请求 metrics；合并得到的清单为 None，耗时分布由各部分保存的延迟样本重新计算
+        self.metrics = {}
+        self.data = {
+            "run_id": run_id,
+            "shard": list(shard) if shard else None,
+            "started_at": datetime.datetime.now().isoformat(timespec='seconds'),
+            "finished_at": None,
+            "wall_seconds": None,
+            "command": sys.argv,
+            "options": options or {},
+            "prompts": {},
+            "data_files": {},
+            "models": {},
+            "results": {},
+            "reports": {},
+        }
+
+    def add_prompt(self, name, text):
+        self.data["prompts"][name] = text_hash(text)
+
+    def add_data_file(self, path):
+        self.data["data_files"][os.path.basename(path)] = {"path": path, "sha256": file_hash(path)}
+
+    def add_model(self, model_key, config):
+        self.data["models"][model_key] = {"model_name": config['model_name'], "config": config}
+
+    def _entry(self, model_key, dataset):
+        return self.data["results"].setdefault(f"{model_key} / {dataset}", {"model": model_key, "dataset": dataset})
+
+    def add_metrics(self, model_key, dataset, metrics_list, processed=None):
+        """
+        本次运行中实际发送的请求的 metrics（不含从断点恢复的条目、重复任务与打包请求中的其余条目）；
+        processed 为本次运行完成的条目数（包括重复任务与打包的条目），用于计算 items/s。
+        """
+        entry = self._entry(model_key, dataset)
+        entry["requests"] = len(metrics_list)
+        entry["processed"] = len(metrics_list) if processed is None else processed
+        entry["timing"] = summarize(metrics_list)
+        # 保留延迟样本，合并分片或多次 --resume 的清单时可以重新计算百分位
+        entry["latencies"] = [round(m["latency"], 4) for m in metrics_list if m.get("latency") is not None]
+        entry["latency_histogram"] = histogram(entry["latencies"])
+        entry["usage"] = {field: sum(m.get(field) or 0 for m in metrics_list) for field in USAGE_FIELDS}
+        entry["retries"] = sum(max(0, (m.get("attempts") or 1) - 1) for m in metrics_list)
+        entry["cached"] = sum(1 for m in metrics_list if m.get("cached"))
+        self.metrics.setdefault(model_key, []).extend(metrics_list)
+
+    def add_elapsed(self, elapsed):
+        """{model_key: 该模型全部任务完成所用的秒数}，用于计算吞吐。"""
+        for model_key, seconds in elapsed.items():
+            if model_key in self.data["models"]:
+                self.data["models"][model_key]["seconds"] = seconds
+
+    def add_output(self, model_key, dataset, path):
+        """逐条读取结果文件，统计条目数与错误分类，并计算 BLEU / chrF / sense 命中率。"""
+        errors = Counter()
+
+        def scan():
+            for item in iter_items(path):
+                if item.get("error"):
+                    errors[error_class(item["error"])] += 1
+                yield item
+
+        scores = evaluate_results({(model_key, None, dataset): scan()})["by_dataset"][f"{model_key} / {dataset}"]
+        entry = self._entry(model_key, dataset)
+        entry["output"] = path
+        entry["items"] = scores["items"]
+        entry["errors"] = sum(errors.values())
+        entry["error_classes"] = dict(errors)
+        entry["quality"] = {field: scores[field] for field in QUALITY_FIELDS}
+
+    def add_report(self, name, reports):
+        if reports:
+            self.data["reports"][name] = reports
+
+    def finish(self):
+        """
+        汇总每个模型的吞吐（本次完成的条目数 / 秒，另记请求数 / 秒）、耗时分布、token 用量与按注册表价格估算的费用。
+        """
+        for model_key, model in self.data["models"].items():
+            entries = [e for e in self.data["results"].values() if e["model"] == model_key]
+            if self.metrics is not None:
+                metrics_list = self.metrics.get(model_key, [])
+            else:
+                metrics_list = [{"latency": value} for e in entries for value in e.get("latencies", [])]
+            requests = sum(e.get("requests", 0) for e in entries)
+            processed = sum(e.get("processed", 0) for e in entries)
+            usage = {field: sum(e.get("usage", {}).get(field, 0) for e in entries) for field in USAGE_FIELDS}
+            config = model["config"]
+            cost = None
+            if config.get('input_price') is not None and config.get('output_price') is not None:
+                cost = (usage['prompt_tokens'] * config['input_price']
+                        + usage['completion_tokens'] * config['output_price']) / 1e6
+            seconds = model.get("seconds")
+            model.update({
+                "requests": requests,
+                "processed": processed,
+                "throughput": processed / seconds if seconds else None,
+                "request_rate": requests / seconds if seconds else None,
+                "timing": summarize(metrics_list),
+                "latency_histogram": histogram([m["latency"] for m in metrics_list if m.get("latency") is not None]),
+                "usage": usage,
+                "cost": cost,
+                "retries": sum(e.get("retries", 0) for e in entries),
+                "errors": sum(e.get("errors", 0) for e in entries),
+            })
+        if self.metrics is not None:
+            self.data["finished_at"] = datetime.datetime.now().isoformat(timespec='seconds')
+            self.data["wall_seconds"] = time.monotonic() - self.started
+
+    def write(self, runs_dir=DEFAULT_RUNS_DIR, resume=False, replace=False):
+        """
+        写入清单文件，返回路径。同名清单已存在时：resume 为 True 则与之合并（本次作为新的一部分），
+        replace 为 True 则覆盖（用于由各分片清单重新合并出的清单），否则抛出 FileExistsError。
+        """
+        Path(runs_dir).mkdir(parents=True, exist_ok=True)
+        path = manifest_path(self.data["run_id"], self.data["shard"], runs_dir)
+        data = self.data
+        if os.path.exists(path) and not replace:
+            if not resume:
+                raise FileExistsError(f"{path} already exists, pass --resume to add this run to it")
+            merged = RunManifest.combine([load_manifest(path), self.data])
+            merged.finish()
+            data = merged.data
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        return path
+
+    @classmethod
+    def combine(cls, manifests):
+        """
+        合并同一 run_id 的多份清单（各分片的清单，或同一分片多次 --resume 的清单），各部分原样保存在 parts 中。
+        请求数、用量、重试次数与延迟直方图相加，耗时分布由延迟样本重新计算（只有 latency）；
+        结果文件的条目数、错误分类与质量分数取最后一份带结果文件的清单。
+        模型耗时在同一分片内相加（先后运行），不同分片之间取最大值（并行运行）。
+        合并后需调用 finish() 汇总每个模型。
+        """
+        parts = [part for m in manifests for part in (m.get("parts") or [m])]
+        shards = {tuple(part["shard"]) if part.get("shard") else None for part in parts}
+        last = parts[-1]
+        manifest = cls(parts[0]["run_id"], last["options"], parts[0].get("shard") if len(shards) == 1 else None)
+        manifest.metrics = None
+        data = manifest.data
+        data.update({
+            "started_at": min(part["started_at"] for part in parts),
+            "finished_at": max(part["finished_at"] or part["started_at"] for part in parts),
+            "wall_seconds": _span(parts, lambda part: part.get("wall_seconds")),
+            "command": last["command"],
+            "prompts": last["prompts"],
+            "data_files": last["data_files"],
+            "parts": parts,
+        })
+        for part in parts:
+            for model_key, model in part["models"].items():
+                data["models"][model_key] = {"model_name": model["model_name"], "config": model["config"]}
+        for model_key in data["models"]:
+            with_model = [part for part in parts if model_key in part["models"]]
+            data["models"][model_key]["seconds"] = _span(with_model, lambda part: part["models"][model_key].get("seconds"))
+
+        for part in parts:
+            for entry in part["results"].values():
+                target = manifest._entry(entry["model"], entry["dataset"])
+                for field in COUNT_FIELDS:
+                    target[field] = target.get(field, 0) + entry.get(field, 0)
+                usage = target.setdefault("usage", dict.fromkeys(USAGE_FIELDS, 0))
+                for field in USAGE_FIELDS:
+                    usage[field] += (entry.get("usage") or {}).get(field, 0)
+                target.setdefault("latencies", []).extend(entry.get("latencies", []))
+                if "output" in entry:
+                    target.update({field: entry[field] for field in OUTPUT_FIELDS if field in entry})
+        for entry in data["results"].values():
+            entry["timing"] = summarize([{"latency": value} for value in entry["latencies"]])
+            entry["latency_histogram"] = histogram(entry["latencies"])
+        return manifest
+
+def _span(parts, value):
+    """同一分片内各部分的值相加，不同分片之间取最大值；全部缺失时返回 None。"""
+    by_shard = {}
+    for part in parts:
+        if value(part) is not None:
+            key = tuple(part["shard"]) if part.get("shard") else None
+            by_shard[key] = by_shard.get(key, 0) + value(part)
+    return max(by_shard.values()) if by_shard else None
+
+def manifest_path(run_id, shard=None, runs_dir=DEFAULT_RUNS_DIR):
+    return os.path.join(runs_dir, f"{run_id}{shard_suffix(shard)}.json")
+
+def shard_manifest_paths(run_id, runs_dir=DEFAULT_RUNS_DIR):
+    return sorted(glob.glob(os.path.join(glob.escape(runs_dir), f"{glob.escape(run_id)}.shard-*-of-*.json")))
+
+def load_manifest(run, runs_dir=DEFAULT_RUNS_DIR):
+    """run 可以是清单文件路径，也可以是 run_id（分片运行的清单为 {run_id}.shard-{i}-of-{N}）。"""
+    path = run if os.path.exists(run) else os.path.join(runs_dir, f"{run}.json")
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+# ========================== 运行对比 ==========================
+def _p95(timing):
+    return (timing or {}).get("latency", {}).get("p95")
+
+def _error_rate(entry):
+    return entry["errors"] / entry["items"] if entry.get("items") else None
+
+def compare_runs(manifests, max_throughput_drop=0.2, max_latency_increase=0.25, max_error_increase=0.02,
+                 max_quality_drop=1.0):
+    """
+    以第一个运行为基准，逐个对比其余运行，返回 (表格行, 回归列表)。
+
+    回归判定：吞吐（items/s）下降超过 max_throughput_drop（比例）、p95 延迟上升超过 max_latency_increase（比例）、
+    错误率上升超过 max_error_increase（绝对值）、BLEU / chrF 下降超过 max_quality_drop 分，
+    或 sense 命中率下降超过 max_quality_drop 个百分点。
+    """
+    rows = []
+    regressions = []
+
+    def check(name, metric, base_value, value, worse):
+        if base_value is None or value is None:
+            return
+        if worse(base_value, value):
+            regressions.append(f"{name} {metric}: {base_value:.3f} -> {value:.3f}")
+
+    models = list(dict.fromkeys(key for m in manifests for key in m["models"]))
+    for model_key in models:
+        values = [m["models"].get(model_key, {}) for m in manifests]
+        rows.append((model_key, "items/s", [v.get("throughput") for v in values]))
+        rows.append((model_key, "requests/s", [v.get("request_rate") for v in values]))
+        rows.append((model_key, "latency p50", [(v.get("timing") or {}).get("latency", {}).get("p50") for v in values]))
+        rows.append((model_key, "latency p95", [_p95(v.get("timing")) for v in values]))
+        rows.append((model_key, "retries", [v.get("retries") for v in values]))
+        rows.append((model_key, "cost $", [v.get("cost") for v in values]))
+        for run, value in zip(manifests[1:], values[1:]):
+            name = f"{run['run_id']} {model_key}"
+            check(name, "throughput", values[0].get("throughput"), value.get("throughput"),
+                  lambda b, v: b > 0 and (b - v) / b > max_throughput_drop)
+            check(name, "latency p95", _p95(values[0].get("timing")), _p95(value.get("timing")),
+                  lambda b, v: b > 0 and (v - b) / b > max_latency_increase)
+
+    keys = list(dict.fromkeys(key for m in manifests for key in m["results"]))
+    for key in keys:
+        entries = [m["results"].get(key, {}) for m in manifests]
+        rows.append((key, "error rate", [_error_rate(e) for e in entries]))
+        for field in ('bleu', 'chrf', 'sense_hit_rate'):
+            rows.append((key, field, [(e.get("quality") or {}).get(field) for e in entries]))
+        for run, entry in zip(manifests[1:], entries[1:]):
+            name = f"{run['run_id']} {key}"
+            check(name, "error rate", _error_rate(entries[0]), _error_rate(entry),
+                  lambda b, v: v - b > max_error_increase)
+            base_quality = entries[0].get("quality") or {}
+            quality = entry.get("quality") or {}
+            for field, scale in (('bleu', 1), ('chrf', 1), ('sense_hit_rate', 100)):
+                check(name, field, base_quality.get(field), quality.get(field),
+                      lambda b, v, scale=scale: (b - v) * scale > max_quality_drop)
+    return rows, regressions
+
+def format_comparison(manifests, rows):
+    width = max([len(m["run_id"]) for m in manifests] + [10])
+    lines = [f"{'':<56} {'':<12} " + " ".join(f"{m['run_id']:>{width}}" for m in manifests)]
+    for name, metric, values in rows:
+        cells = " ".join(f"{value:>{width}.3f}" if value is not None else f"{'-':>{width}}" for value in values)
+        lines.append(f"{name:<56} {metric:<12} {cells}")
+    return "\n".join(lines)
+
+def list_runs(runs_dir=DEFAULT_RUNS_DIR):
+    lines = []
+    for path in sorted(glob.glob(os.path.join(glob.escape(runs_dir), '*.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        parts = f"  ({len(manifest['parts'])} parts)" if manifest.get("parts") else ""
+        name = os.path.splitext(os.path.basename(path))[0]
+        lines.append(f"{name}  {manifest['started_at']}  {', '.join(manifest['models'])}{parts}")
+    return "\n".join(lines)
+
+# ========================== 主函数 ==========================
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and compare run manifests")
+    parser.add_argument('--runs-dir', default=DEFAULT_RUNS_DIR, help="Directory containing {run_id}.json manifests")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('list', help="List recorded runs")
+
+    compare_parser = subparsers.add_parser('compare', help="Compare runs side by side; the first run is the baseline")
+    compare_parser.add_argument('runs', nargs='+', help="Run ids ({run_id} or {run_id}.shard-{i}-of-{N}) or manifest paths (at least two)")
+    compare_parser.add_argument('--max-throughput-drop', type=float, default=0.2,
+                                help="Flag a model whose items/s drops by more than this fraction (default 0.2)")
+    compare_parser.add_argument('--max-latency-increase', type=float, default=0.25,
+                                help="Flag a model whose p95 latency rises by more than this fraction (default 0.25)")
+    compare_parser.add_argument('--max-error-increase', type=float, default=0.02,
+                                help="Flag a dataset whose error rate rises by more than this (absolute, default 0.02)")
+    compare_parser.add_argument('--max-quality-drop', type=float, default=1.0,
+                                help="Flag BLEU/chrF drops of more than this many points and sense hit rate drops "
+                                     "of more than this many percentage points (default 1.0)")
+    compare_parser.add_argument('--json', type=str, default=None, help="Also write the comparison to this JSON file")
+
+    args = parser.parse_args()
+    if args.command == 'list':
+        print(list_runs(args.runs_dir))
+        return
+
+    if len(args.runs) < 2:
+        parser.error("compare needs at least two runs")
+    manifests = [load_manifest(run, args.runs_dir) for run in args.runs]
+    rows, regressions = compare_runs(
+        manifests, args.max_throughput_drop, args.max_latency_increase, args.max_error_increase, args.max_quality_drop
+    )
+    print(format_comparison(manifests, rows))
+    if regressions:
+        print(f"\n{len(regressions)} regressions against {manifests[0]['run_id']}:")
+        for regression in regressions:
+            print(f"  REGRESSION {regression}")
+    else:
+        print(f"\nNo regressions against {manifests[0]['run_id']}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                "runs": [m["run_id"] for m in manifests],
+                "rows": [{"name": name, "metric": metric, "values": values} for name, metric, values in rows],
+                "regressions": regressions,
+            }, f, ensure_ascii=False, indent=4)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
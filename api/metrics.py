@@ -0,0 +1,165 @@
+import argparse
+import json
+import math
+import os
+import re
+import time
+
+# ========================== 请求计时 ==========================
+class StreamTimer:
+    """记录一次请求的开始时间、首个推理 token 与首个答案 token 的到达时间以及 chunk 数。"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics if metrics is not None else {}
+        self.started = time.monotonic()
+        self.chunks = 0
+
+    def on_chunk(self, reasoning=None, answer=None):
+        self.chunks += 1
+        elapsed = time.monotonic() - self.started
+        if reasoning and 'ttft_reasoning' not in self.metrics:
+            self.metrics['ttft_reasoning'] = elapsed
+        if answer and 'ttft_answer' not in self.metrics:
+            self.metrics['ttft_answer'] = elapsed
+
+    def finish(self, usage=None):
+        self.metrics['latency'] = time.monotonic() - self.started
+        if self.chunks:
+            self.metrics['chunks'] = self.chunks
+        record_usage(self.metrics, usage)
+        return self.metrics
+
+def record_usage(metrics, usage):
+    """把 OpenAI 兼容响应中的 usage 写入 metrics（prompt / completion / reasoning tokens）。"""
+    if usage is None:
+        return
+    metrics['prompt_tokens'] = getattr(usage, 'prompt_tokens', None)
+    metrics['completion_tokens'] = getattr(usage, 'completion_tokens', None)
+    details = getattr(usage, 'completion_tokens_details', None)
+    reasoning_tokens = getattr(details, 'reasoning_tokens', None) if details is not None else None
+    if reasoning_tokens is not None:
+        metrics['reasoning_tokens'] = reasoning_tokens
+
+# ========================== 汇总统计 ==========================
+SUMMARY_FIELDS = [
+    'queue_wait',
+    'ttft_reasoning',
+    'ttft_answer',
+    'latency',
+    'total_time',
+    'attempts',
+    'chunks',
+    'image_bytes',
+    'prompt_tokens',
+    'completion_tokens',
+    'reasoning_tokens',
+]
+
+def percentile(values, q):
+    """线性插值的百分位数，values 需已排序。"""
+    if not values:
+        return None
+    pos = (len(values) - 1) * q / 100
+    lower = math.floor(pos)
+    upper = math.ceil(pos)
+    if lower == upper:
+        return values[lower]
+    return values[lower] + (values[upper] - values[lower]) * (pos - lower)
+
+def summarize(metrics_list):
+    """对一组 metrics 的每个字段计算 count / p50 / p95 / p99 / mean。"""
+    summary = {}
+    for field in SUMMARY_FIELDS:
+        values = sorted(m[field] for m in metrics_list if m.get(field) is not None)
+        if not values:
+            continue
+        summary[field] = {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "mean": sum(values) / len(values),
+        }
+    return summary
+
+# 延迟直方图的桶上界（秒），最后一个桶收集其余所有值
+HISTOGRAM_EDGES = [0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300]
+
+def histogram(values, edges=HISTOGRAM_EDGES):
+    """返回 {"<=上界": 数量, ..., ">最大上界": 数量}。"""
+    counts = {f"<={edge}": 0 for edge in edges}
+    counts[f">{edges[-1]}"] = 0
+    for value in values:
+        for edge in edges:
+            if value <= edge:
+                counts[f"<={edge}"] += 1
+                break
+        else:
+            counts[f">{edges[-1]}"] += 1
+    return counts
+
+def run_label(model, run=None):
+    """汇总表中的行名：指定运行时与结果文件名一致，为 {model}-{run_id}，否则为 model。"""
+    return f"{model}-{run}" if run else model
+
+def summarize_results(results_by_key):
+    """
+    :param results_by_key: {(model, run, dataset): [item, ...]}，run 为 None 时不区分运行
+    :return:               {"by_dataset": {"model-run / dataset": 汇总}, "by_model": {"model-run": 汇总}}
+    """
+    by_model = {}
+    by_dataset = {}
+    for (model, run, dataset), items in results_by_key.items():
+        label = run_label(model, run)
+        metrics_list = [item["metrics"] for item in items if item.get("metrics")]
+        by_dataset[f"{label} / {dataset}"] = summarize(metrics_list)
+        by_model.setdefault(label, []).extend(metrics_list)
+    return {
+        "by_dataset": by_dataset,
+        "by_model": {model: summarize(metrics_list) for model, metrics_list in by_model.items()},
+    }
+
+def format_summary(summary, fields=('queue_wait', 'ttft_answer', 'latency', 'total_time', 'completion_tokens')):
+    lines = []
+    for section in ('by_model', 'by_dataset'):
+        for name, stats in summary[section].items():
+            parts = []
+            for field in fields:
+                if field in stats:
+                    s = stats[field]
+                    parts.append(f"{field} p50={s['p50']:.2f} p95={s['p95']:.2f} p99={s['p99']:.2f}")
+            lines.append(f"{name}: " + ("; ".join(parts) if parts else "no metrics"))
+    return "\n".join(lines)
+
+# ========================== 主函数 ==========================
+# 结果文件名为 {model}-{run_id}_{dataset}，run_id 为 {date}-{时分秒}-{4 位随机十六进制}；
+# 旧的结果文件只有日期，同样可以解析
+RUN_ID_PATTERN = r'(?P<date>\d{4}-\d{2}-\d{2})(?:-\d{6}-[0-9a-f]{4})?'
+RUN_ID = re.compile(RUN_ID_PATTERN)
+OUTPUT_NAME = re.compile(rf'^(?P<model>.+)-(?P<run>{RUN_ID_PATTERN})_(?P<dataset>.+\.json)$')
+
+def parse_result_name(path):
+    """从结果文件名 {model}-{run_id}_{dataset} 中解析出 (model, run_id, dataset)，无法解析时返回 (文件名, None, '')。"""
+    match = OUTPUT_NAME.match(os.path.basename(path))
+    return match.group('model', 'run', 'dataset') if match else (os.path.basename(path), None, '')
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise per-request latency and token metrics of result files")
+    parser.add_argument('files', nargs='+', help="Result files named {model}-{run_id}_{dataset}.json; each run is summarised separately")
+    parser.add_argument('--json', action='store_true', help="Print the full summary as JSON")
+    args = parser.parse_args()
+
+    results_by_key = {}
+    for path in args.files:
+        key = parse_result_name(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            results_by_key.setdefault(key, []).extend(json.load(f))
+
+    summary = summarize_results(results_by_key)
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=4))
+    else:
+        print(format_summary(summary))
+
+if __name__ == "__main__":
+    main()
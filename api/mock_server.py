@@ -0,0 +1,411 @@
+import argparse
+import email.parser
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ========================== 模拟响应 ==========================
+def mock_answer(body):
+    """
+    取 prompt 最后一行（待翻译的英文句子）生成确定性的模拟译文；
+    prompt 以 JSON 句子数组结尾时（打包请求）返回对应的 JSON 译文数组。
+    """
+    text = ""
+    for part in body["messages"][-1]["content"]:
+        if part.get("type") == "text":
+            text = part["text"]
+    text = text.strip()
+    start = text.rfind("\n[")
+    if start >= 0 and text.endswith("]"):
+        try:
+            sentences = json.loads(text[start:])
+        except json.JSONDecodeError:
+            sentences = None
+        if isinstance(sentences, list):
+            return json.dumps([f"模拟译文：{sentence}" for sentence in sentences], ensure_ascii=False)
+    sentence = text.splitlines()[-1] if text else ""
+    return f"模拟译文：{sentence}"
+
+def mock_usage(answer, reasoning=""):
+    return {
+        "prompt_tokens": 1000,
+        "completion_tokens": len(answer) + len(reasoning),
+        "total_tokens": 1000 + len(answer) + len(reasoning),
+        "completion_tokens_details": {"reasoning_tokens": len(reasoning)},
+    }
+
+def mock_completion(body):
+    answer = mock_answer(body)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": mock_usage(answer),
+    }
+
+def mock_chunk(completion_id, model, delta=None, finish_reason=None, usage=None):
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        "usage": usage,
+    }
+
+def mock_stream(body, config, rng):
+    """
+    逐个生成流式响应的 chunk：先输出 reasoning_chunks 段推理内容，
+    再把答案按 chunk_chars 个字符切分输出，相邻 chunk 之间间隔 chunk_interval 秒。
+    """
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    model = body.get("model", "mock")
+    answer = mock_answer(body)
+    reasoning = "".join(f"思考第{i + 1}步。" for i in range(config.reasoning_chunks))
+
+    pieces = [{"role": "assistant", "content": ""}]
+    pieces += [{"reasoning_content": f"思考第{i + 1}步。"} for i in range(config.reasoning_chunks)]
+    step = max(1, config.chunk_chars)
+    pieces += [{"content": answer[i:i + step]} for i in range(0, len(answer), step)]
+
+    for i, delta in enumerate(pieces):
+        if i and config.chunk_interval:
+            time.sleep(config.chunk_interval * (0.5 + rng.random()))
+        yield mock_chunk(completion_id, model, delta)
+    yield mock_chunk(completion_id, model, {}, finish_reason="stop")
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield mock_chunk(completion_id, model, usage=mock_usage(answer, reasoning))
+
+# ========================== 负载模拟 ==========================
+class MockConfig:
+    """
+    模拟服务的负载特征：
+
+    latency:        首个字节前的延迟分布，fixed / uniform / lognormal
+    latency_mean:   延迟均值（秒）；uniform 时在 [0, 2 * mean] 内均匀分布
+    latency_sigma:  lognormal 分布的形状参数，越大长尾越明显
+    rate_429:       返回 429（带 retry-after-ms 响应头）的概率
+    rate_400:       返回 400 的概率
+    retry_after_ms: 429 响应建议的等待毫秒数
+    chunk_interval: 流式响应相邻 chunk 的平均间隔（秒）
+    chunk_chars:    流式响应每个答案 chunk 的字符数
+    reasoning_chunks: 流式响应在答案前输出的推理 chunk 数
+    """
+
+    def __init__(self, latency='fixed', latency_mean=0.0, latency_sigma=0.5, rate_429=0.0, rate_400=0.0,
+                 retry_after_ms=200, chunk_interval=0.0, chunk_chars=4, reasoning_chunks=0, seed=None):
+        self.latency = latency
+        self.latency_mean = latency_mean
+        self.latency_sigma = latency_sigma
+        self.rate_429 = rate_429
+        self.rate_400 = rate_400
+        self.retry_after_ms = retry_after_ms
+        self.chunk_interval = chunk_interval
+        self.chunk_chars = chunk_chars
+        self.reasoning_chunks = reasoning_chunks
+        self.seed = seed
+
+    def sample_latency(self, rng):
+        if self.latency_mean <= 0:
+            return 0.0
+        if self.latency == 'uniform':
+            return rng.uniform(0, 2 * self.latency_mean)
+        if self.latency == 'lognormal':
+            # 取 mu 使分布均值等于 latency_mean
+            mu = math.log(self.latency_mean) - self.latency_sigma ** 2 / 2
+            return rng.lognormvariate(mu, self.latency_sigma)
+        return self.latency_mean
+
+# ========================== 服务端状态 ==========================
+class MockState:
+    """
+    保存上传的文件与批处理任务。
+
+    批处理任务每被查询一次推进一个状态：validating -> in_progress -> completed，
+    完成时逐行调用 mock_completion 生成输出文件。
+    """
+
+    def __init__(self, config=None):
+        self.lock = threading.Lock()
+        self.files = {}
+        self.batches = {}
+        self.config = config or MockConfig()
+        self.rng = random.Random(self.config.seed)
+        self.counts = {"requests": 0, "rate_limited": 0, "bad_request": 0}
+
+    def draw(self):
+        """为一次 chat completions 请求抽取 (延迟, 注入的错误状态码或 None)。"""
+        with self.lock:
+            self.counts["requests"] += 1
+            latency = self.config.sample_latency(self.rng)
+            roll = self.rng.random()
+            if roll < self.config.rate_429:
+                self.counts["rate_limited"] += 1
+                return latency, 429
+            if roll < self.config.rate_429 + self.config.rate_400:
+                self.counts["bad_request"] += 1
+                return latency, 400
+            return latency, None
+
+    def add_file(self, filename, purpose, content):
+        file_id = f"file-{uuid.uuid4().hex}"
+        with self.lock:
+            self.files[file_id] = {
+                "id": file_id,
+                "object": "file",
+                "bytes": len(content),
+                "created_at": int(time.time()),
+                "filename": filename,
+                "purpose": purpose,
+                "status": "processed",
+                "content": content,
+            }
+        return self._file_info(file_id)
+
+    def _file_info(self, file_id):
+        return {k: v for k, v in self.files[file_id].items() if k != "content"}
+
+    def create_batch(self, request):
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        lines = [line for line in self.files[request["input_file_id"]]["content"].decode('utf-8').splitlines() if line.strip()]
+        with self.lock:
+            self.batches[batch_id] = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": request["endpoint"],
+                "input_file_id": request["input_file_id"],
+                "completion_window": request["completion_window"],
+                "status": "validating",
+                "created_at": int(time.time()),
+                "output_file_id": None,
+                "error_file_id": None,
+                "metadata": request.get("metadata"),
+                "request_counts": {"total": len(lines), "completed": 0, "failed": 0},
+            }
+        return self.batches[batch_id]
+
+    def retrieve_batch(self, batch_id):
+        with self.lock:
+            batch = self.batches[batch_id]
+            if batch["status"] == "validating":
+                batch["status"] = "in_progress"
+                return dict(batch)
+            if batch["status"] != "in_progress":
+                return dict(batch)
+        self._complete_batch(batch)
+        return dict(batch)
+
+    def _complete_batch(self, batch):
+        content = self.files[batch["input_file_id"]]["content"].decode('utf-8')
+        output = []
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            output.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": mock_completion(request["body"])},
+                "error": None,
+            }, ensure_ascii=False))
+        output_file = self.add_file(f"{batch['id']}_output.jsonl", "batch_output", ("\n".join(output) + "\n").encode('utf-8'))
+        with self.lock:
+            batch["output_file_id"] = output_file["id"]
+            batch["request_counts"]["completed"] = len(output)
+            batch["status"] = "completed"
+            batch["completed_at"] = int(time.time())
+
+# ========================== HTTP 处理 ==========================
+def parse_multipart(content_type, body):
+    """用标准库 email 解析 multipart/form-data，返回 {字段名: (文件名, 内容字节)}。"""
+    message = email.parser.BytesParser().parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode('utf-8') + body
+    )
+    fields = {}
+    for part in message.get_payload():
+        name = part.get_param('name', header='content-disposition')
+        fields[name] = (part.get_filename(), part.get_payload(decode=True))
+    return fields
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 才能保持长连接，便于验证客户端的连接复用
+    protocol_version = 'HTTP/1.1'
+    # 关闭 Nagle 算法：否则长连接上头部与响应体分两次写出时，客户端的延迟 ACK 会给每个响应额外增加约 40ms
+    disable_nagle_algorithm = True
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length)
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message, headers=None):
+        data = json.dumps({"error": {"message": message, "type": "invalid_request_error"}}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, body):
+        """以 server-sent events 输出流式响应，使用 chunked 传输以保持长连接。"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        with self.state.lock:
+            rng = random.Random(self.state.rng.random())
+        for chunk in mock_stream(body, self.state.config, rng):
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _chat_completions(self, body):
+        latency, status = self.state.draw()
+        if latency:
+            time.sleep(latency)
+        if status == 429:
+            self._send_error(429, "Rate limit exceeded (injected)", {"retry-after-ms": str(self.state.config.retry_after_ms)})
+        elif status == 400:
+            self._send_error(400, "Bad request (injected)")
+        elif body.get("stream"):
+            self._send_stream(body)
+        else:
+            self._send_json(mock_completion(body))
+
+    def do_POST(self):
+        path = self.path.split('?')[0].rstrip('/')
+        body = self._read_body()
+        if path.endswith('/chat/completions'):
+            self._chat_completions(json.loads(body))
+        elif path.endswith('/files'):
+            fields = parse_multipart(self.headers['Content-Type'], body)
+            filename, content = fields['file']
+            purpose = fields['purpose'][1].decode('utf-8')
+            self._send_json(self.state.add_file(filename or 'upload.jsonl', purpose, content))
+        elif path.endswith('/batches'):
+            request = json.loads(body)
+            if request.get("input_file_id") not in self.state.files:
+                self._send_error(400, f"Unknown input_file_id: {request.get('input_file_id')}")
+                return
+            self._send_json(self.state.create_batch(request))
+        else:
+            self._send_error(404, f"Unknown endpoint: {self.path}")
+
+    def do_GET(self):
+        path = self.path.split('?')[0].rstrip('/')
+        match = re.search(r'/files/([^/]+)/content$', path)
+        if match and match.group(1) in self.state.files:
+            content = self.state.files[match.group(1)]["content"]
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            return
+        match = re.search(r'/batches/([^/]+)$', path)
+        if match and match.group(1) in self.state.batches:
+            self._send_json(self.state.retrieve_batch(match.group(1)))
+            return
+        self._send_error(404, f"Unknown endpoint: {self.path}")
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端取消流式请求或退出时断开连接属于正常情况，不打印堆栈
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+def start_server(host='127.0.0.1', port=0, config=None):
+    """
+    在后台线程中启动模拟服务，返回 (server, base_url)。port 为 0 时自动选择空闲端口。
+    服务端状态（含请求与注入错误计数）可通过 server.state 访问。
+    """
+    state = MockState(config)
+    handler = type('BoundMockHandler', (MockHandler,), {"state": state})
+    server = MockServer((host, port), handler)
+    server.state = state
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1/"
+
+# ========================== 主函数 ==========================
+def add_config_arguments(parser):
+    parser.add_argument('--latency', choices=['fixed', 'uniform', 'lognormal'], default='fixed', help="Latency distribution")
+    parser.add_argument('--latency-mean', type=float, default=0.0, help="Mean latency before the first byte (seconds)")
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help="Shape of the lognormal latency distribution")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="Probability of an injected 429 response")
+    parser.add_argument('--rate-400', type=float, default=0.0, help="Probability of an injected 400 response")
+    parser.add_argument('--retry-after-ms', type=int, default=200, help="retry-after-ms header sent with injected 429s")
+    parser.add_argument('--chunk-interval', type=float, default=0.0, help="Mean seconds between streamed chunks")
+    parser.add_argument('--chunk-chars', type=int, default=4, help="Characters per streamed answer chunk")
+    parser.add_argument('--reasoning-chunks', type=int, default=0, help="Reasoning chunks streamed before the answer")
+    parser.add_argument('--seed', type=int, default=None, help="Random seed for latencies and injected errors")
+
+def config_from_args(args):
+    return MockConfig(
+        latency=args.latency,
+        latency_mean=args.latency_mean,
+        latency_sigma=args.latency_sigma,
+        rate_429=args.rate_429,
+        rate_400=args.rate_400,
+        retry_after_ms=args.retry_after_ms,
+        chunk_interval=args.chunk_interval,
+        chunk_chars=args.chunk_chars,
+        reasoning_chunks=args.reasoning_chunks,
+        seed=args.seed,
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI-compatible chat completions and batch API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.host, args.port, config_from_args(args))
+    print(f"Mock API listening on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import argparse
+import gzip
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dataio import iter_items
+from metrics import OUTPUT_NAME
+
+# ========================== 路径配置 ==========================
+DEFAULT_OUTPUT_PATH = '/mnt/workspace/xintong/lyx/results/AmbiTrans_api/records.parquet'
+
+# ========================== 记录格式 ==========================
+# 每个条目规范化后的字段与类型（pyarrow 中的类型构造函数名），同时决定输出文件的列顺序
+RECORD_SCHEMA = [
+    ('model', 'string'),
+    ('dataset', 'string'),
+    ('date', 'string'),
+    ('run', 'string'),
+    ('idx', 'string'),
+    ('image', 'string'),
+    ('en', 'string'),
+    ('answer', 'string'),
+    ('reasoning', 'string'),
+    ('cleaned', 'bool_'),
+    ('prompt_tokens', 'int64'),
+    ('completion_tokens', 'int64'),
+    ('reasoning_tokens', 'int64'),
+    ('latency', 'float64'),
+    ('total_time', 'float64'),
+    ('attempts', 'int64'),
+    ('cached', 'bool_'),
+    ('truncated', 'string'),
+    ('error', 'string'),
+    ('error_class', 'string'),
+    ('source', 'string'),
+]
+
+# ========================== 译文清理 ==========================
+_CODE_FENCE = re.compile(r'^```[\w-]*\s*\n?(.*?)\n?```$', re.S)
+_PREFIX = re.compile(
+    r'^(?:final\s+)?(?:chinese\s+)?(?:translation|answer)\s*(?:\(chinese\))?\s*[:：]\s*'
+    r'|^(?:最终)?(?:中文)?(?:翻译|译文|答案)\s*[:：]\s*',
+    re.I
+)
+_EMPHASIS = re.compile(r'\*\*(.+?)\*\*|__(.+?)__')
+_QUOTES = [('"', '"'), ("'", "'"), ('“', '”'), ('‘', '’'), ('「', '」'), ('『', '』'), ('《', '》')]
+
+def clean_answer(text):
+    """
+    去掉模型在译文外额外输出的格式：markdown 代码块与加粗、"Translation:" / "译文：" 等前缀、
+    以及包住整句译文的引号。只处理包在整个译文外层的内容，句中的引号与标点保持不变。
+    """
+    text = text.strip()
+    match = _CODE_FENCE.match(text)
+    if match:
+        text = match.group(1).strip()
+    text = _EMPHASIS.sub(lambda m: m.group(1) or m.group(2), text)
+    text = text.lstrip('#> ').strip()
+    text = _PREFIX.sub('', text, count=1).strip()
+    for left, right in _QUOTES:
+        if len(text) >= 2 and text.startswith(left) and text.endswith(right) and left not in text[1:-1]:
+            text = text[1:-1].strip()
+            break
+    return text
+
+# ========================== 错误分类 ==========================
+_ERROR_CLASSES = [
+    ('rate_limited', re.compile(r'Error code: 429|rate limit', re.I)),
+    ('bad_request', re.compile(r'Error code: 4\d\d')),
+    ('server_error', re.compile(r'Error code: 5\d\d')),
+    ('timeout', re.compile(r'timed out|timeout', re.I)),
+    ('connection', re.compile(r'Connection error', re.I)),
+    ('deadline', re.compile(r'no response within')),
+    ('budget', re.compile(r'reached its budget')),
+    ('length_cap', re.compile(r'exceeded \d+ tokens')),
+    ('missing', re.compile(r'^Missing from')),
+]
+
+def error_class(error):
+    """把 error 字段中的异常文本归为粗粒度的错误类别，没有错误时返回 None。"""
+    if not error:
+        return None
+    for name, pattern in _ERROR_CLASSES:
+        if pattern.search(error):
+            return name
+    return 'other'
+
+# ========================== 规范化 ==========================
+def normalize_item(item, model, dataset, date, source, run=None):
+    """把结果文件中的一个条目转成 RECORD_SCHEMA 描述的扁平记录。"""
+    result = item.get("result")
+    if isinstance(result, dict):
+        raw, reasoning = result.get("answer") or "", result.get("reasoning") or None
+    else:
+        raw, reasoning = result or "", None
+    answer = clean_answer(raw)
+    metrics = item.get("metrics") or {}
+    error = item.get("error")
+    if error is not None and not isinstance(error, str):
+        error = json.dumps(error, ensure_ascii=False)
+    return {
+        "model": model,
+        "dataset": dataset,
+        "date": date,
+        "run": run,
+        "idx": str(item.get("idx")),
+        "image": item.get("image"),
+        "en": item.get("en"),
+        "answer": answer,
+        "reasoning": reasoning,
+        "cleaned": answer != raw.strip(),
+        "prompt_tokens": metrics.get("prompt_tokens"),
+        "completion_tokens": metrics.get("completion_tokens"),
+        "reasoning_tokens": metrics.get("reasoning_tokens"),
+        "latency": metrics.get("latency"),
+        "total_time": metrics.get("total_time"),
+        "attempts": metrics.get("attempts"),
+        "cached": bool(metrics.get("cached")),
+        "truncated": metrics.get("truncated"),
+        "error": error,
+        "error_class": error_class(error),
+        "source": source,
+    }
+
+def normalize_file(path):
+    """在子进程中规范化一个结果文件，返回记录列表。"""
+    match = OUTPUT_NAME.match(os.path.basename(path))
+    if match:
+        model, date, run, dataset = match.group('model', 'date', 'run', 'dataset')
+    else:
+        model, date, run, dataset = os.path.basename(path), None, None, ''
+    return [normalize_item(item, model, dataset, date, path, run) for item in iter_items(path)]
+
+def find_result_files(paths):
+    """展开命令行中的文件与目录；目录下只收集名称符合 {model}-{run_id}_{dataset}.json 的结果文件。"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names) if OUTPUT_NAME.match(name))
+        else:
+            files.append(path)
+    return files
+
+def normalize_files(paths, workers=None):
+    """多进程并行规范化所有结果文件，返回按文件顺序排列的记录列表。"""
+    by_path = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(normalize_file, path): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                by_path[futures[future]] = future.result()
+            except Exception as e:
+                print(f"Failed on {futures[future]}: {e}")
+    return [record for path in paths for record in by_path.get(path, [])]
+
+# ========================== 写出 ==========================
+def write_records(records, path):
+    """
+    写出为 Parquet（需要 pyarrow）。未安装 pyarrow 时退回 gzip 压缩的 JSON Lines，
+    文件名改为 .jsonl.gz，返回实际写入的路径。
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        path = os.path.splitext(path)[0] + '.jsonl.gz'
+        print(f"Warning: pyarrow is not installed, writing gzip-compressed JSON Lines to {path} instead of Parquet")
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return path
+
+    schema = pa.schema([(name, getattr(pa, type_name)()) for name, type_name in RECORD_SCHEMA])
+    columns = {name: [record[name] for record in records] for name, _ in RECORD_SCHEMA}
+    table = pa.Table.from_pydict(columns, schema=schema)
+    pq.write_table(table, path, compression='zstd')
+    return path
+
+def read_records(path):
+    """读取 write_records 的输出：Parquet 返回 pyarrow.Table，.jsonl.gz 返回记录列表。"""
+    if path.endswith('.jsonl.gz'):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    import pyarrow.parquet as pq
+    return pq.read_table(path)
+
+# ========================== 主函数 ==========================
+def main():
+    parser = argparse.ArgumentParser(
+        description="Normalize result files into typed records (clean answer, reasoning, usage, latency, error class) "
+                    "and write them to one Parquet file"
+    )
+    parser.add_argument('paths', nargs='+', help="Result files or directories containing {model}-{run_id}_{dataset}.json files")
+    parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT_PATH, help="Output Parquet file")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    files = find_result_files(args.paths)
+    print(f"Normalizing {len(files)} result files")
+    records = normalize_files(files, args.workers)
+    path = write_records(records, args.output)
+    cleaned = sum(1 for record in records if record["cleaned"])
+    errors = sum(1 for record in records if record["error"])
+    print(f"Wrote {len(records)} records to {path} ({cleaned} answers cleaned, {errors} errors)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import email.utils
+import random
+import threading
+import time
+from collections import deque
+
+# ========================== 错误分类 ==========================
+RATE_LIMITED = 'rate_limited'
+RETRYABLE = 'retryable'
+FATAL = 'fatal'
+
+# 单张图片在请求中大致占用的 token 数，用于 tokens/min 预算估计
+IMAGE_TOKEN_ESTIMATE = 1000
+# 预留给回答的 token 数
+ANSWER_TOKEN_ESTIMATE = 200
+
+def classify_error(e):
+    """
+    按异常类型判断是否应当重试：
+    429 -> RATE_LIMITED；超时、连接错误、5xx -> RETRYABLE；
+    400 等其余请求错误以及本地异常 -> FATAL，直接失败不再重试。
+    """
+    # 出现异常时客户端必然已经创建，这里导入 openai 不增加启动开销
+    import openai
+
+    if isinstance(e, openai.RateLimitError):
+        return RATE_LIMITED
+    if isinstance(e, (openai.APITimeoutError, openai.APIConnectionError)):
+        return RETRYABLE
+    if isinstance(e, openai.APIStatusError):
+        if e.status_code == 429:
+            return RATE_LIMITED
+        if e.status_code in (408, 409) or e.status_code >= 500:
+            return RETRYABLE
+    return FATAL
+
+def retry_after(e):
+    """从响应头 retry-after-ms / retry-after 中读取服务端建议的等待秒数，没有则返回 None。"""
+    response = getattr(e, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=60.0):
+    """指数退避 + full jitter：在 [0, min(max_delay, base_delay * 2^attempt)] 内随机取值。"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+def estimate_tokens(text):
+    """粗略估计 token 数：中日韩字符按 1 个 token，其余字符按 4 个字符 1 个 token。"""
+    cjk = sum(1 for ch in text if '\u2e80' <= ch <= '\u9fff' or '\uf900' <= ch <= '\ufaff')
+    return cjk + (len(text) - cjk + 3) // 4
+
+def estimate_request_tokens(text):
+    return estimate_tokens(text) + IMAGE_TOKEN_ESTIMATE + ANSWER_TOKEN_ESTIMATE
+
+# ========================== 限流器 ==========================
+class TokenBucket:
+    """
+    线程安全的令牌桶，按每分钟 per_minute 的速率补充。
+    采用预约方式：令牌可以透支，调用方按透支量等待相应时间，保证先到先得。
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount):
+        """预约 amount 个令牌，返回需要等待的秒数。"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+
+class RateLimiter:
+    """
+    单个模型共享的限流器，同时约束 requests/min 与 tokens/min。
+    收到带 Retry-After 的 429 时整个模型暂停，避免所有线程同时撞上限额。
+    """
+
+    def __init__(self, rpm=None, tpm=None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        # 可选的 AdaptiveConcurrency，由 call_with_retry 在每次尝试前后获取 / 归还
+        self.adaptive = None
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def acquire(self, tokens=0):
+        while True:
+            with self.lock:
+                wait = self.paused_until - time.monotonic()
+            if wait <= 0:
+                break
+            time.sleep(wait)
+
+        wait = 0.0
+        if self.requests:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        if wait > 0:
+            time.sleep(wait)
+
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+def get_limiter(model_key, rpm=None, tpm=None):
+    """返回 model_key 对应的共享限流器，同一进程内的所有任务共用同一个实例。"""
+    with _LIMITERS_LOCK:
+        if model_key not in _LIMITERS:
+            _LIMITERS[model_key] = RateLimiter(rpm, tpm)
+        return _LIMITERS[model_key]
+
+# ========================== 自适应并发 ==========================
+class AdaptiveConcurrency:
+    """
+    AIMD 自适应并发：限制同一模型同时在途的请求数。
+
+    请求成功且延迟正常时并发上限加性增长（每轮约 +1）；遇到 429、超时或 5xx，
+    或延迟超过最近成功请求中位数的 latency_factor 倍时乘性减半。
+    每次减半后至少间隔一个中位延迟才会再次减半，避免同一波错误把并发连续压到最低。
+    命中缓存的请求不参与调整。
+    """
+
+    DECREASE_FACTOR = 0.5
+    LATENCY_WINDOW = 100
+    MIN_SAMPLES = 20
+
+    def __init__(self, initial, minimum=1, maximum=64, latency_factor=3.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.latency_factor = latency_factor
+        self.in_flight = 0
+        self.latencies = deque(maxlen=self.LATENCY_WINDOW)
+        self.last_decrease = 0.0
+        self.increases = 0
+        self.decreases = 0
+        self.peak = self.limit
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def _median(self):
+        if len(self.latencies) < self.MIN_SAMPLES:
+            return None
+        return sorted(self.latencies)[len(self.latencies) // 2]
+
+    def release(self, latency=None, kind=None, cached=False):
+        """
+        :param latency: 成功请求的耗时（秒）
+        :param kind:    失败请求的错误类型（classify_error 的返回值），成功时为 None
+        :param cached:  是否命中响应缓存
+        """
+        with self.condition:
+            self.in_flight -= 1
+            median = self._median()
+            spike = kind is None and median is not None and latency > self.latency_factor * median
+            if kind in (RATE_LIMITED, RETRYABLE) or spike:
+                now = time.monotonic()
+                if now - self.last_decrease >= (median or 1.0):
+                    self.limit = max(self.minimum, self.limit * self.DECREASE_FACTOR)
+                    self.last_decrease = now
+                    self.decreases += 1
+            elif kind is None and not cached:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                self.peak = max(self.peak, self.limit)
+                self.increases += 1
+            if kind is None and not cached:
+                self.latencies.append(latency)
+            self.condition.notify_all()
+
+    def report(self):
+        with self.condition:
+            return (f"concurrency {int(self.limit)} (peak {int(self.peak)}, range {self.minimum}-{self.maximum}), "
+                    f"{self.increases} increases, {self.decreases} decreases")
+
+def enable_adaptive(model_key, initial, maximum, minimum=1):
+    """为 model_key 的共享限流器启用 AIMD 自适应并发。"""
+    limiter = get_limiter(model_key)
+    limiter.adaptive = AdaptiveConcurrency(initial, minimum, maximum)
+    return limiter.adaptive
+
+def adaptive_reports():
+    with _LIMITERS_LOCK:
+        limiters = dict(_LIMITERS)
+    return {key: limiter.adaptive.report() for key, limiter in limiters.items() if limiter.adaptive}
+
+# ========================== 重试 ==========================
+def call_with_retry(call, limiter=None, tokens=0, max_retries=5, base_delay=1.0, max_delay=60.0, label=None, stats=None):
+    """
+    调用 call()，按错误类型决定是否重试。
+
+    :param call:        无参数的 API 调用函数
+    :param limiter:     RateLimiter，每次尝试前先获取额度；启用了自适应并发时同时占用一个并发名额
+    :param tokens:      本次请求估计消耗的 token 数
+    :param max_retries: 最大重试次数
+    :param label:       打印日志时使用的条目标识
+    :param stats:       可选 dict，记录尝试次数 attempts 与等待额度/退避的总秒数 retry_wait
+    :return:            call() 的返回值；无法重试或重试耗尽时抛出最后一次的异常
+    """
+    attempt = 0
+    stats = stats if stats is not None else {}
+    stats['retry_wait'] = 0.0
+    adaptive = limiter.adaptive if limiter else None
+    while True:
+        stats['attempts'] = attempt + 1
+        if limiter:
+            waited = time.monotonic()
+            limiter.acquire(tokens)
+            if adaptive:
+                adaptive.acquire()
+            stats['retry_wait'] += time.monotonic() - waited
+        started = time.monotonic()
+        try:
+            result = call()
+        except Exception as e:
+            kind = classify_error(e)
+            if adaptive:
+                adaptive.release(kind=kind)
+            if kind == FATAL or attempt >= max_retries:
+                raise
+
+            delay = retry_after(e)
+            if delay is None:
+                delay = backoff_delay(attempt, base_delay, max_delay)
+            else:
+                delay = min(delay, max_delay)
+
+            print(f"Error on {label}: {e}. Retry {attempt + 1}/{max_retries} after {delay:.1f} sec...")
+            if kind == RATE_LIMITED and limiter and retry_after(e) is not None:
+                # 由限流器统一暂停该模型，下一轮 acquire 时等待
+                limiter.pause(delay)
+            else:
+                time.sleep(delay)
+                stats['retry_wait'] += delay
+            attempt += 1
+        else:
+            if adaptive:
+                adaptive.release(latency=time.monotonic() - started, cached=stats.get('cached', False))
+            return result
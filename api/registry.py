@@ -0,0 +1,140 @@
+import copy
+import json
+
+# ========================== 模型注册表 ==========================
+# 每个模型的全部调用策略都在这里配置，新增模型或调整参数时不再需要复制脚本：
+#   model_name:    实际请求的模型名
+#   stream:        是否使用流式调用，流式调用才能在超出长度上限时提前取消
+#   return_reasoning: 结果是否为 {"reasoning", "answer"}（如 qvq-max），否则只保存答案字符串
+#   max_answer_tokens / max_reasoning_tokens: 流式调用时答案 / 推理内容的估计 token 上限，
+#                  超出后在客户端取消请求，None 表示不限制
+#   image_policy:  图片预处理策略，raw 为原图 base64，compress 为压缩到 5MB 以内的 JPEG
+#   extra_body:    额外请求参数，如关闭 Gemini 思考功能
+#   concurrency:   同时在途的最大请求数
+#   rpm / tpm:     每分钟请求数 / 估计 token 数上限，None 表示不限制
+#   timeout:       单个请求的超时（秒）
+#   adaptive:      是否启用 AIMD 自适应并发，以 concurrency 为初始值，在 1 ~ max_concurrency 之间调整
+#   max_concurrency: 自适应并发的上限，None 表示 concurrency 的 4 倍
+#   budget:        本次运行的费用上限（美元），按响应 usage 与 input_price / output_price 计算，达到后暂停该模型
+#   hedge_percentile: 请求超过该模型最近延迟的这一百分位（如 95）仍未返回时补发一份对冲请求，先返回者胜出，
+#                  None 表示不对冲；流式模型的落后请求会被关闭，非流式请求只能丢弃结果
+#   deadline:      每次请求的硬性截止时间（秒，从发出到收到完整结果），超过后取消并记为失败，None 表示不限制
+#   output_subdir: 结果保存在输出目录下的子目录，None 表示直接保存在输出目录
+#   input_price / output_price: 每百万输入 / 输出 token 的价格（美元，官方标价），用于 --dry-run 估算费用与 budget；
+#                  经代理计费不同时用 --model-config 覆盖，None 表示未知
+DEFAULT_CONFIG = {
+    'model_name': None,
+    'stream': False,
+    'return_reasoning': False,
+    'max_answer_tokens': None,
+    'max_reasoning_tokens': None,
+    'image_policy': 'raw',
+    'extra_body': None,
+    'concurrency': 8,
+    'rpm': None,
+    'tpm': None,
+    'timeout': 600,
+    'adaptive': False,
+    'max_concurrency': None,
+    'budget': None,
+    'hedge_percentile': None,
+    'deadline': None,
+    'output_subdir': None,
+    'input_price': None,
+    'output_price': None,
+}
+
+GEMINI_NO_THINKING = {
+    "google": {
+        "thinkingConfig": {
+            "thinkingBudget": 0
+        }
+    }
+}
+
+MODEL_REGISTRY = {
+    'gpt-4o': {
+        'model_name': 'gpt-4o-2024-11-20',
+        'input_price': 2.5,
+        'output_price': 10.0,
+    },
+    'o1': {
+        'model_name': 'o1-2024-12-17',
+        'concurrency': 4,
+        'input_price': 15.0,
+        'output_price': 60.0,
+    },
+    'qvq': {
+        'model_name': 'qvq-max',
+        'stream': True,
+        'return_reasoning': True,
+        'concurrency': 4,
+    },
+    'qwen': {
+        'model_name': 'qwen-vl-max',
+    },
+    'gemini-2.0-flash': {
+        'model_name': 'gemini-2.0-flash-001',
+        'concurrency': 16,
+        'timeout': 120,
+        'input_price': 0.1,
+        'output_price': 0.4,
+    },
+    'claude-3-7-sonnet': {
+        'model_name': 'anthropic.claude-3-7-sonnet-20250219-v1:0',
+        'image_policy': 'compress',
+        'concurrency': 4,
+        'input_price': 3.0,
+        'output_price': 15.0,
+    },
+    'gemini-2.5-flash': {
+        'model_name': 'gemini-2.5-flash-preview-04-17',
+        'concurrency': 16,
+        'timeout': 300,
+        'input_price': 0.15,
+        'output_price': 3.5,
+    },
+    'gemini-2.5-flash-nothink': {
+        'model_name': 'gemini-2.5-flash-preview-04-17',
+        'extra_body': GEMINI_NO_THINKING,
+        'concurrency': 16,
+        'timeout': 120,
+        'output_subdir': 'gemini-2.5-flash',
+        'input_price': 0.15,
+        'output_price': 0.6,
+    },
+    'gemini-2.5-pro': {
+        'model_name': 'gemini-2.5-pro-preview-05-06',
+        'concurrency': 4,
+        'input_price': 1.25,
+        'output_price': 10.0,
+    },
+}
+
+def get_model_config(model_key):
+    """返回 model_key 的完整配置（未设置的字段取 DEFAULT_CONFIG 中的默认值）。"""
+    if model_key not in MODEL_REGISTRY:
+        raise ValueError(f"Unknown model: {model_key}. Please add it to MODEL_REGISTRY.")
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    config.update(copy.deepcopy(MODEL_REGISTRY[model_key]))
+    return config
+
+def load_overrides(path):
+    """
+    从 JSON 文件读取配置覆盖并合并进注册表，格式为 {model_key: {字段: 值}}。
+    文件中出现的新 model_key 会作为新模型注册（必须提供 model_name）。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        overrides = json.load(f)
+    return apply_overrides(overrides)
+
+def apply_overrides(overrides):
+    """把 {model_key: {字段: 值}} 合并进注册表（命令行参数也通过这里覆盖配置）。"""
+    for model_key, fields in overrides.items():
+        unknown = set(fields) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown config fields for {model_key}: {sorted(unknown)}")
+        if model_key not in MODEL_REGISTRY and not fields.get('model_name'):
+            raise ValueError(f"New model {model_key} must set model_name")
+        MODEL_REGISTRY.setdefault(model_key, {}).update(fields)
+    return overrides
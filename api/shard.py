@@ -0,0 +1,54 @@
+import argparse
+import glob
+import hashlib
+import os
+
+from checkpoint import load_index
+
+# ========================== 任务分片 ==========================
+def parse_shard(value):
+    """解析命令行中的 i/N（i 从 0 开始），返回 (i, N)。"""
+    index, sep, count = value.partition('/')
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard must look like i/N, got {value!r}")
+    if not sep or count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard must satisfy 0 <= i < N, got {value!r}")
+    return index, count
+
+def shard_of(model_key, dataset, idx, count):
+    """
+    (模型, 数据集, idx) 所属的分片编号。使用 sha1 而不是 hash()，
+    保证不同进程、不同机器上的划分结果一致。
+    """
+    digest = hashlib.sha1(f"{model_key}|{dataset}|{idx}".encode('utf-8')).hexdigest()
+    return int(digest[:16], 16) % count
+
+def in_shard(model_key, dataset, idx, shard):
+    """shard 为 None 时表示不分片，所有条目都属于当前进程。"""
+    if shard is None:
+        return True
+    index, count = shard
+    return shard_of(model_key, dataset, idx, count) == index
+
+def shard_suffix(shard):
+    return f".shard-{shard[0]}-of-{shard[1]}" if shard else ""
+
+# ========================== 合并 ==========================
+def shard_checkpoint_paths(checkpoint_dir, model_key):
+    return sorted(glob.glob(os.path.join(glob.escape(checkpoint_dir), f"{glob.escape(model_key)}.shard-*-of-*.jsonl")))
+
+def merge_records(paths):
+    """
+    合并多个分片的断点文件索引，返回 {(model, dataset, idx): (文件路径, 偏移)}，
+    结果用 checkpoint.read_record 按需读取。
+    同一条目出现在多个文件中时（如改变过分片数），优先取成功的记录。
+    """
+    merged = {}
+    for path in paths:
+        for key, (offset, ok) in load_index(path).items():
+            if key in merged and merged[key][2] and not ok:
+                continue
+            merged[key] = (path, offset, ok)
+    return {key: (path, offset) for key, (path, offset, _) in merged.items()}
@@ -1,26 +1,33 @@
-import openai
-from openai import OpenAI
-import tqdm
 import json
-from pathlib import Path
-from PIL import Image
-from io import BytesIO
 import os
 import sys
-import base64
 import time
 import argparse
-import datetime
+from collections import Counter
+
+from ratelimit import (
+    ANSWER_TOKEN_ESTIMATE, adaptive_reports, call_with_retry, enable_adaptive, estimate_request_tokens, estimate_tokens,
+    get_limiter
+)
+from checkpoint import Checkpoint, load_index, read_record
+from client import configure as configure_client, connection_stats, get_client
+from batch import build_request, make_custom_id, read_batch_results, submit_batch, wait_for_batch, write_batch_file
+from cache import cached, configure as configure_cache, image_digest, is_cached
+from images import encode_with_policy, configure as configure_images, DEFAULT_CACHE_DIR as IMAGE_CACHE_DIR
+from registry import MODEL_REGISTRY, apply_overrides, get_model_config, load_overrides
+from engine import Scheduler, queue_wait
+from dataio import OrderedWriter, ResultWriter, iter_items
+from dedup import DedupPlan
+from shard import in_shard, merge_records, parse_shard, shard_checkpoint_paths, shard_suffix
+from metrics import RUN_ID, StreamTimer, format_summary, summarize_results
+from budget import budget_reports, configure_budget, get_budget
+from hedge import RequestCancelled, get_hedge_stats, hedge_reports, hedged_call
+from manifest import RunManifest, load_manifest, manifest_path, new_run_id, shard_manifest_paths
 
 # ========================== 路径配置 ==========================
-# API配置文件路径
-with open('/mnt/workspace/xintong/api_key.txt', 'r') as f:
-    lines = f.readlines()
-    
-API_KEY = lines[0].strip()
-BASE_URL = lines[1].strip()
-openai.api_key = API_KEY
-openai.base_url = BASE_URL
+# API配置文件路径（第一行 API key，第二行 base URL），在第一次发送请求时才读取
+API_KEY_FILE = '/mnt/workspace/xintong/api_key.txt'
+configure_client(key_file=API_KEY_FILE)
 
 # 数据文件路径
 DATA_DIR = '/mnt/workspace/xintong/lyx/AmbiTrans_api/data/'
@@ -34,100 +41,205 @@ IMAGE_FOLDER_MMA = '/mnt/workspace/xintong/pjh/dataset/MMA/'
 
 # 输出路径
 OUTPUT_BASE_DIR = '/mnt/workspace/xintong/lyx/results/AmbiTrans_api'
+# 断点文件路径，每个模型一个 JSONL 文件
+CHECKPOINT_DIR = os.path.join(OUTPUT_BASE_DIR, 'checkpoints')
+# API 响应缓存路径
+CACHE_PATH = os.path.join(OUTPUT_BASE_DIR, 'cache', 'responses.sqlite')
+# 批处理请求文件与任务状态路径
+BATCH_DIR = os.path.join(OUTPUT_BASE_DIR, 'batches')
+# 每次运行的清单文件路径
+RUNS_DIR = os.path.join(OUTPUT_BASE_DIR, 'runs')
 
 # ========================== 模型配置 ==========================
-MODELS = {
-    'gpt-4o': 'gpt-4o-2024-11-20',
-    'o1': 'o1-2024-12-17',
-    'qvq': 'qvq-max',
-    'qwen': 'qwen-vl-max',
-    'gemini-2.0-flash': 'gemini-2.0-flash-001',
-    'claude-3-7-sonnet': 'anthropic.claude-3-7-sonnet-20250219-v1:0',
-    'gemini-2.5-flash': 'gemini-2.5-flash-preview-04-17',
-    'gemini-2.5-pro': 'gemini-2.5-pro-preview-05-06'
-}
-
-STANDARD_MODELS = [
-    'gpt-4o-2024-11-20',
-    'o1-2024-12-17',
-    'qwen-vl-max',
-    'gemini-2.0-flash-001',
-    'anthropic.claude-3-7-sonnet-20250219-v1:0',
-    'gemini-2.5-flash-preview-04-17',
-    'gemini-2.5-pro-preview-05-06'
-]
-
-STREAM_MODELS = ['qvq-max']
-
-def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
+# 各模型的调用策略见 registry.py 中的 MODEL_REGISTRY
+
+USER_PROMPT = """You are a multimodal translation assistant. Your task is to translate the following English sentence into accurate Chinese by fully leveraging both the text and the accompanying image.
+
+Use the visual information to resolve any ambiguities or vague expressions in the sentence. Your translation must reflect the most precise meaning based on the image.
+
+Only output the final Chinese translation. Do not include any explanation.
+
+Now translate:  
+{en}"""
+
+# 打包模式：同一张图片的多个句子合并为一次请求，要求返回 JSON 字符串数组
+PACKED_PROMPT = """You are a multimodal translation assistant. Your task is to translate each of the following English sentences into accurate Chinese by fully leveraging both the text and the accompanying image.
+
+Use the visual information to resolve any ambiguities or vague expressions in the sentences. Each translation must reflect the most precise meaning based on the image.
+
+Return only a JSON array of {count} strings, where the i-th string is the final Chinese translation of the i-th sentence. Do not include any explanation.
+
+Now translate:  
+{sentences}"""
 
 # ========================== API调用函数 ==========================
-def call_api_standard(text, image, model_name):
-    base64_image = encode_image(image)
-    response = openai.chat.completions.create(
+def build_messages(text, base64_image):
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
+                },
+                {"type": "text", "text": text},
+            ],
+        }
+    ]
+
+@cached()
+def call_api_standard(text, image, model_name, image_policy='raw', extra_body=None, timeout=None, metrics=None):
+    base64_image = encode_with_policy(image, image_policy)
+    timer = StreamTimer(metrics)
+    timer.metrics['image_bytes'] = len(base64_image)
+    response = get_client().chat.completions.create(
         model=model_name,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
-                    },
-                    {"type": "text", "text": text},
-                ],
-            }
-        ],
+        messages=build_messages(text, base64_image),
+        extra_body=extra_body,
+        timeout=timeout,
     )
+    timer.finish(response.usage)
     return response.choices[0].message.content
 
-def call_api_stream(text, image, model_name):
-    reasoning_content = ""
-    answer_content = ""
-    is_answering = False
-    base64_image = encode_image(image)
+class StreamCapExceeded(Exception):
+    """推理内容超出 max_reasoning_tokens，请求已在客户端取消（不重试）。"""
+
+
+@cached()
+def call_api_stream(text, image, model_name, image_policy='raw', extra_body=None, timeout=None, metrics=None,
+                    max_answer_tokens=None, max_reasoning_tokens=None, cancel=None):
+    """
+    流式调用，返回 {"reasoning", "answer"}。
+
+    答案超过 max_answer_tokens 时取消请求并返回已收到的部分（metrics 中记 truncated）；
+    推理内容超过 max_reasoning_tokens 时取消请求并抛出 StreamCapExceeded。
+    token 数按 estimate_tokens 估计。
+    cancel（threading.Event）被设置时关闭连接并抛出 RequestCancelled，用于对冲请求中的落后者。
+    """
+    reasoning_parts = []
+    answer_parts = []
+    reasoning_tokens = 0
+    answer_tokens = 0
+    usage = None
+    base64_image = encode_with_policy(image, image_policy)
+    timer = StreamTimer(metrics)
+    timer.metrics['image_bytes'] = len(base64_image)
 
-    completion = openai.chat.completions.create(
+    completion = get_client().chat.completions.create(
         model=model_name,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
-                    },
-                    {"type": "text", "text": text},
-                ],
-            },
-        ],
+        messages=build_messages(text, base64_image),
+        extra_body=extra_body,
+        timeout=timeout,
         stream=True,
+        stream_options={"include_usage": True},
     )
 
-    for chunk in completion:
-        if not chunk.choices:
-            continue
-        delta = chunk.choices[0].delta
+    def finish_partial():
+        # 提前结束的请求通常收不到 usage，completion 记为已生成部分的估计 token 数，用于计费与对冲开销统计
+        timer.finish(usage)
+        if usage is None:
+            timer.metrics['completion_tokens'] = reasoning_tokens + answer_tokens
 
-        if hasattr(delta, 'reasoning_content') and delta.reasoning_content is not None:
-            reasoning_content += delta.reasoning_content
-        else:
-            if delta.content and not is_answering:
-                is_answering = True
-            if delta.content:
-                answer_content += delta.content
-
-    return {"reasoning": reasoning_content, "answer": answer_content}
-
-def call_api(text, image, model_name):
-    if model_name in STREAM_MODELS:
-        return call_api_stream(text, image, model_name)
-    elif model_name in STANDARD_MODELS:
-        return call_api_standard(text, image, model_name)
+    try:
+        for chunk in completion:
+            if cancel is not None and cancel.is_set():
+                raise RequestCancelled("request cancelled")
+            if getattr(chunk, 'usage', None) is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+
+            if hasattr(delta, 'reasoning_content') and delta.reasoning_content is not None:
+                reasoning_parts.append(delta.reasoning_content)
+                timer.on_chunk(reasoning=delta.reasoning_content)
+                reasoning_tokens += estimate_tokens(delta.reasoning_content)
+                if max_reasoning_tokens and reasoning_tokens > max_reasoning_tokens:
+                    timer.metrics['truncated'] = 'reasoning'
+                    raise StreamCapExceeded(f"reasoning exceeded {max_reasoning_tokens} tokens, request cancelled")
+            else:
+                if delta.content:
+                    answer_parts.append(delta.content)
+                    answer_tokens += estimate_tokens(delta.content)
+                timer.on_chunk(answer=delta.content)
+                if max_answer_tokens and answer_tokens > max_answer_tokens:
+                    timer.metrics['truncated'] = 'answer'
+                    break
+    except Exception:
+        # 被取消、超出推理上限、超时或连接中断
+        finish_partial()
+        raise
+    finally:
+        # 提前退出时关闭响应，服务端随之停止生成
+        completion.close()
+
+    if timer.metrics.get('truncated'):
+        finish_partial()
+    else:
+        timer.finish(usage)
+    return {"reasoning": "".join(reasoning_parts), "answer": "".join(answer_parts)}
+
+def call_api(text, image, model_key, metrics=None, cancel=None, timeout=None):
+    """timeout 为本次请求的超时（秒），不超过注册表中的 timeout；用于让超过截止时间的请求随之结束。"""
+    config = get_model_config(model_key)
+    timeout = min(config['timeout'], timeout) if timeout is not None else config['timeout']
+    if config['stream']:
+        result = call_api_stream(
+            text, image, config['model_name'], config['image_policy'], config['extra_body'],
+            timeout=timeout, metrics=metrics,
+            max_answer_tokens=config['max_answer_tokens'], max_reasoning_tokens=config['max_reasoning_tokens'],
+            cancel=cancel
+        )
     else:
-        raise ValueError(f"Unknown model: {model_name}. Please add it to STANDARD_MODELS or STREAM_MODELS.")
+        result = call_api_standard(
+            text, image, config['model_name'], config['image_policy'], config['extra_body'],
+            timeout=timeout, metrics=metrics
+        )
+    return format_result(result, config['return_reasoning'])
+
+def request_api(text, image, model_key, metrics, limiter=None, tokens=0, budget=None):
+    """
+    一次请求（由 call_with_retry 负责重试）。注册表中设置了 hedge_percentile 或 deadline 的模型
+    经 hedged_call 发送：超过延迟百分位时补发一份对冲请求，超过截止时间时取消并放弃。
+    设置了 deadline 时每份请求的 HTTP 超时不超过剩余时间，被放弃的请求（包括无法中途取消的非流式请求）
+    到期后随之结束，不会继续占用连接池中的连接。
+
+    指定 budget（BudgetGuard）时每次尝试前检查费用上限，尝试结束后无论成功、失败还是被截断都按其 usage 计费；
+    被放弃的对冲请求与超时请求在其结束后计费。
+    """
+    config = get_model_config(model_key)
+    if budget:
+        budget.check()
+    # 每次尝试使用独立的 metrics，计费时不会重复计入之前失败的尝试
+    attempt_metrics = {}
+    try:
+        if not config['hedge_percentile'] and not config['deadline']:
+            return call_api(text, image, model_key, attempt_metrics)
+        end = time.monotonic() + config['deadline'] if config['deadline'] else None
+
+        def attempt(cancel, hedge_metrics):
+            timeout = max(0.0, end - time.monotonic()) if end is not None else None
+            return call_api(text, image, model_key, hedge_metrics, cancel, timeout)
+
+        return hedged_call(
+            attempt,
+            attempt_metrics,
+            get_hedge_stats(model_key),
+            config['hedge_percentile'],
+            config['deadline'],
+            before_hedge=(lambda: limiter.acquire(tokens)) if limiter else None,
+            on_abandoned=(lambda m: budget.record(m, tokens)) if budget else None
+        )
+    finally:
+        metrics.update(attempt_metrics)
+        if budget:
+            budget.record(attempt_metrics, tokens)
+
+def format_result(result, return_reasoning):
+    """流式与非流式调用（以及缓存中的旧结果）统一成该模型的结果格式。"""
+    if return_reasoning:
+        return result if isinstance(result, dict) else {"reasoning": "", "answer": result}
+    return result["answer"] if isinstance(result, dict) else result
 
 # ========================== 数据处理函数 ==========================
 def get_image_folder(filename):
@@ -136,64 +248,595 @@ def get_image_folder(filename):
     else:
         return IMAGE_FOLDER_3AM
 
-def process_single_file(file_path, model_key, model_name, today):
-    print(f"Processing file: {file_path} with model: {model_name}")
+def get_checkpoint(model_key, resume=False, shard=None):
+    return Checkpoint(os.path.join(CHECKPOINT_DIR, f"{model_key}{shard_suffix(shard)}.jsonl"), resume=resume)
 
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+def iter_shard_items(file_path, model_key, shard=None):
+    """流式读取数据文件中属于当前分片的条目。"""
+    dataset = os.path.basename(file_path)
+    for item in iter_items(file_path):
+        if in_shard(model_key, dataset, item["idx"], shard):
+            yield item
 
-    image_folder = get_image_folder(os.path.basename(file_path))
+def prepare_file(file_path, model_key, max_retries=5, checkpoint=None):
+    """
+    构造单条目翻译函数。每个条目完成后立即追加写入 checkpoint。
 
-    user_prompt = """You are a multimodal translation assistant. Your task is to translate the following English sentence into accurate Chinese by fully leveraging both the text and the accompanying image.
+    :return: 处理单个条目的函数
+    """
+    dataset = os.path.basename(file_path)
+    image_folder = get_image_folder(dataset)
+    limiter = get_limiter(model_key)
+    budget = get_budget(model_key)
 
-Use the visual information to resolve any ambiguities or vague expressions in the sentence. Your translation must reflect the most precise meaning based on the image.
+    def translate_item(item):
+        text = USER_PROMPT.format(en=item["en"])
+        idx = item["idx"]
+        image_path = os.path.join(image_folder, item["image"])
 
-Only output the final Chinese translation. Do not include any explanation.
+        metrics = {"queue_wait": queue_wait()}
+        started = time.monotonic()
+        tokens = estimate_request_tokens(text)
+        try:
+            outputs = call_with_retry(
+                lambda: request_api(text, image_path, model_key, metrics, limiter, tokens, budget),
+                limiter=limiter,
+                tokens=tokens,
+                max_retries=max_retries,
+                label=idx,
+                stats=metrics
+            )
+        except Exception as e:
+            print(f"Skipping {idx}: {e}")
+            item["error"] = str(e)
+            outputs = ""
+        metrics["total_time"] = time.monotonic() - started
 
-Now translate:  
-{en}"""
+        item["result"] = outputs
+        item["metrics"] = metrics
+        if checkpoint:
+            checkpoint.append(model_key, dataset, item)
+        return item
 
-    sleep_times = [5, 10, 20, 40, 60]
+    return translate_item
 
-    result = []
+def parse_packed_reply(answer, count):
+    """解析打包请求的回复，返回 count 个译文；格式不符时返回 None。"""
+    start = answer.find('[')
+    end = answer.rfind(']')
+    if start < 0 or end < start:
+        return None
+    try:
+        translations = json.loads(answer[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(translations, list) or len(translations) != count:
+        return None
+    if not all(isinstance(t, str) and t.strip() for t in translations):
+        return None
+    return [t.strip() for t in translations]
 
-    for item in tqdm.tqdm(data, desc=f"Processing {model_key} on {os.path.basename(file_path)}"):
-        text = user_prompt.format(en=item["en"])
-        idx = item["idx"]
-        image_path = os.path.join(image_folder, item["image"])
+def prepare_packed(file_path, model_key, translate_item, max_retries=5, checkpoint=None):
+    """
+    构造打包翻译函数：参数为共享同一张图片的若干条目，一次请求翻译全部句子，
+    回复解析失败或请求出错时退回逐条调用 translate_item。
 
-        last_error = None
+    :return: 处理一组条目的函数，返回处理后的条目列表
+    """
+    dataset = os.path.basename(file_path)
+    image_folder = get_image_folder(dataset)
+    limiter = get_limiter(model_key)
+    budget = get_budget(model_key)
+    return_reasoning = get_model_config(model_key)['return_reasoning']
 
-        for sleep_time in sleep_times:
-            try:
-                outputs = call_api(text, image_path, model_name)
-                break
-            except Exception as e:
-                last_error = e
-                print(f"Error on {idx}: {e}. Retry after sleeping {sleep_time} sec...")
-                if "Error code: 400" in str(e) or "Error code: 429" in str(e):
-                    time.sleep(sleep_time)
+    def translate_group(items):
+        if len(items) == 1:
+            return [translate_item(items[0])]
+        text = PACKED_PROMPT.format(
+            count=len(items),
+            sentences=json.dumps([item["en"] for item in items], ensure_ascii=False, indent=0)
+        )
+        image_path = os.path.join(image_folder, items[0]["image"])
+        label = ",".join(str(item["idx"]) for item in items)
+
+        metrics = {"queue_wait": queue_wait(), "packed": len(items)}
+        started = time.monotonic()
+        tokens = estimate_request_tokens(text)
+        try:
+            outputs = call_with_retry(
+                lambda: request_api(text, image_path, model_key, metrics, limiter, tokens, budget),
+                limiter=limiter,
+                tokens=tokens,
+                max_retries=max_retries,
+                label=label,
+                stats=metrics
+            )
+        except Exception as e:
+            print(f"Packed request for {label} failed, falling back to single requests: {e}")
+            return [translate_item(item) for item in items]
+        metrics["total_time"] = time.monotonic() - started
+
+        answer = outputs["answer"] if return_reasoning else outputs
+        translations = parse_packed_reply(answer, len(items))
+        if translations is None:
+            print(f"Unparseable packed reply for {label}, falling back to single requests")
+            return [translate_item(item) for item in items]
+
+        # 一次请求的用量只记在组内第一个条目上，其余条目记录所属的组，避免汇总时重复计数
+        for item, translation in zip(items, translations):
+            item["result"] = dict(outputs, answer=translation) if return_reasoning else translation
+            item["metrics"] = metrics if item is items[0] else {"packed_with": f"{dataset}#{items[0]['idx']}"}
+            if checkpoint:
+                checkpoint.append(model_key, dataset, item)
+        return items
+
+    return translate_group
+
+def get_output_dir(model_key):
+    subdir = get_model_config(model_key)['output_subdir']
+    return os.path.join(OUTPUT_BASE_DIR, subdir) if subdir else OUTPUT_BASE_DIR
+
+def get_output_path(file_path, model_key, run_id):
+    return os.path.join(get_output_dir(model_key), f"{model_key}-{run_id}_{os.path.basename(file_path)}")
+
+def save_results(result, file_path, model_key, run_id):
+    """把结果（可以是生成器）逐条写入结果文件。"""
+    output_path = get_output_path(file_path, model_key, run_id)
+    print(f"Saving results to: {output_path}")
+    writer = ResultWriter(output_path)
+    try:
+        for item in result:
+            writer.write(item)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return output_path
+
+def image_identity(image_path):
+    """用图片内容哈希识别不同目录下的同一张图片；文件不存在时退回使用路径。"""
+    try:
+        return image_digest(image_path)
+    except OSError:
+        return image_path
+
+def plan_duplicates(model_keys, data_files, shard=None):
+    """规划阶段：找出各模型在所有数据文件中 (prompt, 图片) 完全相同的任务。"""
+    plan = DedupPlan()
+    for model_key in model_keys:
+        for file_path in data_files:
+            if not os.path.exists(file_path):
+                continue
+            dataset = os.path.basename(file_path)
+            image_folder = get_image_folder(dataset)
+            for item in iter_shard_items(file_path, model_key, shard):
+                plan.add(
+                    model_key,
+                    (model_key, dataset, item["idx"]),
+                    USER_PROMPT.format(en=item["en"]),
+                    image_identity(os.path.join(image_folder, item["image"]))
+                )
+    plan.finish_planning()
+    print(plan.report())
+    return plan
+
+def duplicate_result(item, leader, record):
+    """把 leader 的结果复制给重复的条目，metrics 中记录结果来源。"""
+    item["result"] = record.get("result", "")
+    if "error" in record:
+        item["error"] = record["error"]
+    item["metrics"] = {"duplicate_of": f"{leader[1]}#{leader[2]}"}
+    return item
+
+def add_file_job(scheduler, file_path, model_key, run_id, checkpoint, max_retries=5, shard=None, on_finished=None,
+                 plan=None, pack_size=None):
+    """
+    把一个 (模型, 数据集) 注册为调度任务。
+
+    数据文件被流式读取：断点中已成功的条目直接写出，其余条目按需提交给调度器；
+    结果按原始顺序边完成边写入结果文件（分片运行时只写断点）。
+    未按顺序完成的条目只暂存其 idx，写出时再从断点读取，内存占用与数据集大小无关。
+
+    :param on_finished: 任务组完成后调用 on_finished(model_key, dataset, 本次运行的请求 metrics 列表,
+                        本次完成的条目数（包括重复任务与打包请求中的其余条目）)
+    :param plan:        DedupPlan，重复的条目不提交，等 leader 完成后直接复制其结果
+    :param pack_size:   大于 1 时把同一张图片的待处理条目按最多 pack_size 个打包为一次请求
+    :return:            该任务的 OrderedWriter（分片运行时为 None），运行失败或被中断时由调用方 abort()
+    """
+    dataset = os.path.basename(file_path)
+    translate_item = prepare_file(file_path, model_key, max_retries, checkpoint)
+    translate_group = prepare_packed(file_path, model_key, translate_item, max_retries, checkpoint)
+    writer = None
+    if shard is None:
+        writer = OrderedWriter(
+            ResultWriter(get_output_path(file_path, model_key, run_id)),
+            load=lambda idx: checkpoint.get(model_key, dataset, idx)
+        )
+    def needs_request(item):
+        task = (model_key, dataset, item["idx"])
+        return not checkpoint.is_done(*task) and not (plan and plan.leader_of(task))
+
+    # 每张图片待请求的条目数，打包时据此判断一组是否已经凑齐
+    remaining = Counter(item["image"] for item in iter_shard_items(file_path, model_key, shard) if needs_request(item))
+    group_size = pack_size if pack_size and pack_size > 1 else 1
+    requests = sum(-(-count // group_size) for count in remaining.values())
+    groups = {}
+    metrics = []
+    counts = {"resumed": 0, "duplicates": 0, "processed": 0, "waiting": 0, "done": False}
+
+    def load(task):
+        return lambda: checkpoint.get(*task)
+
+    def finish():
+        if not counts["done"] or counts["waiting"]:
+            return
+        if counts["resumed"]:
+            print(f"Resumed {model_key} on {dataset}: {counts['resumed']} items reused from the checkpoint")
+        if counts["duplicates"]:
+            print(f"{model_key} on {dataset}: {counts['duplicates']} duplicate items answered without a request")
+        if writer:
+            print(f"Saving results to: {writer.writer.path}")
+            writer.close()
+        if on_finished:
+            on_finished(model_key, dataset, metrics, counts["processed"] + counts["duplicates"])
+
+    def fan_out(pos, item, leader, record):
+        checkpoint.append(model_key, dataset, duplicate_result(item, leader, record))
+        if writer:
+            writer.add(pos, item["idx"])
+        counts["duplicates"] += 1
+        counts["waiting"] -= 1
+        finish()
+
+    def items():
+        for pos, item in enumerate(iter_shard_items(file_path, model_key, shard)):
+            task = (model_key, dataset, item["idx"])
+            if checkpoint.is_done(*task):
+                counts["resumed"] += 1
+                if writer:
+                    writer.add(pos, item["idx"])
+                if plan:
+                    plan.complete(task, load(task))
+                continue
+            leader = plan.leader_of(task) if plan else None
+            if leader:
+                counts["waiting"] += 1
+                plan.wait(leader, lambda record, pos=pos, item=item, leader=leader: fan_out(pos, item, leader, record))
+            elif group_size == 1:
+                yield [(pos, item)]
+            else:
+                # 同一张图片的条目先暂存，凑满 pack_size 个或该图片的条目全部到齐后作为一组提交
+                image = item["image"]
+                group = groups.setdefault(image, [])
+                group.append((pos, item))
+                if len(group) == min(group_size, remaining[image]):
+                    remaining[image] -= len(group)
+                    yield groups.pop(image)
+
+    def work(group):
+        if len(group) == 1:
+            pos, item = group[0]
+            return [(pos, translate_item(item))]
+        positions = [pos for pos, _ in group]
+        return list(zip(positions, translate_group([item for _, item in group])))
+
+    def on_result(_, value):
+        for pos, result in value:
+            counts["processed"] += 1
+            if "packed_with" not in result["metrics"]:
+                metrics.append(result["metrics"])
+            if writer:
+                writer.add(pos, result["idx"])
+            if plan:
+                plan.complete((model_key, dataset, result["idx"]), load((model_key, dataset, result["idx"])))
+
+    def on_done(_):
+        counts["done"] = True
+        finish()
+
+    scheduler.add_job(model_key, dataset, items(), work, on_done=on_done, on_result=on_result, total=requests)
+    return writer
+
+def process_single_file(file_path, model_key, run_id, concurrency=1, max_retries=5, resume=False):
+    """处理单个 (模型, 数据集)，返回结果文件路径。"""
+    print(f"Processing file: {file_path} with model: {get_model_config(model_key)['model_name']}")
+
+    checkpoint = get_checkpoint(model_key, resume)
+    scheduler = Scheduler({model_key: concurrency})
+    writer = add_file_job(scheduler, file_path, model_key, run_id, checkpoint, max_retries)
+    try:
+        scheduler.run()
+    finally:
+        writer.abort()
+        checkpoint.close()
+    return get_output_path(file_path, model_key, run_id)
+
+def run_all(model_keys, data_files, run_id, concurrency, max_retries=5, resume=False, shard=None, dedup=True,
+            pack_size=None, manifest=None):
+    """
+    将所有 (模型, 数据集, 条目) 任务交给同一个调度器并发执行，
+    每个 (模型, 数据集) 的结果按原始顺序边完成边写入结果文件。
+    dedup 为 True 时先做一次规划，跨数据集完全相同的任务只请求一次；
+    pack_size 大于 1 时同一张图片的句子打包为一次请求。
+
+    指定 shard=(i, N) 时只处理属于第 i 个分片的条目，结果只写入该分片的断点文件，
+    全部分片完成后用 merge_shards 生成结果文件。
+    指定 manifest（RunManifest）时记录本次运行的耗时、用量与对冲 / 自适应并发 / 费用统计。
+    """
+    scheduler = Scheduler(concurrency)
+    checkpoints = {}
+    writers = []
+    finished = {}
+
+    def on_finished(model_key, dataset, metrics, processed):
+        finished[(model_key, None, dataset)] = [{"metrics": m} for m in metrics]
+        if manifest:
+            manifest.add_metrics(model_key, dataset, metrics, processed)
+
+    plan = plan_duplicates(model_keys, data_files, shard) if dedup else None
+    for model_key in model_keys:
+        checkpoint = checkpoints[model_key] = get_checkpoint(model_key, resume, shard)
+        for file_path in data_files:
+            if not os.path.exists(file_path):
+                print(f"Warning: File not found: {file_path}")
+                continue
+            writers.append(add_file_job(scheduler, file_path, model_key, run_id, checkpoint, max_retries, shard,
+                                        on_finished, plan, pack_size))
+
+    try:
+        scheduler.run()
+    finally:
+        # 出错或被中断时丢弃未完成的结果文件（临时文件），已完成的不受影响；结果仍保存在断点中
+        for writer in writers:
+            if writer:
+                writer.abort()
+        for checkpoint in checkpoints.values():
+            checkpoint.close()
+
+    summary = summarize_results(finished)
+    print(format_summary(summary))
+    for model_key, report in hedge_reports().items():
+        print(f"{model_key} hedging: {report}")
+    for model_key, report in adaptive_reports().items():
+        print(f"{model_key} adaptive: {report}")
+    for model_key, report in budget_reports().items():
+        print(f"{model_key} spend: {report}")
+    if manifest:
+        manifest.add_elapsed(scheduler.elapsed)
+        manifest.add_report("hedging", hedge_reports())
+        manifest.add_report("adaptive", adaptive_reports())
+        manifest.add_report("budget", budget_reports())
+    return summary
+
+# ========================== 运行规划 ==========================
+def plan_run(model_keys, data_files, resume=False, shard=None, dedup=True):
+    """
+    --dry-run：不发送请求，统计每个 (模型, 数据集) 的任务数、可从断点或缓存直接得到的条目数、
+    需要实际请求的条目数，并按 estimate_tokens 与注册表中的价格估算 token 数与费用。
+
+    :return: {"model / dataset": {"items", "resumed", "duplicates", "cached", "requests",
+                                  "input_tokens", "output_tokens", "cost"}}
+    """
+    plan = plan_duplicates(model_keys, data_files, shard) if dedup else None
+    rows = {}
+    for model_key in model_keys:
+        config = get_model_config(model_key)
+        options = {"max_answer_tokens": config['max_answer_tokens']} if config['stream'] else None
+        checkpoint_path = os.path.join(CHECKPOINT_DIR, f"{model_key}{shard_suffix(shard)}.jsonl")
+        done = load_index(checkpoint_path) if resume and os.path.exists(checkpoint_path) else {}
+        for file_path in data_files:
+            if not os.path.exists(file_path):
+                print(f"Warning: File not found: {file_path}")
+                continue
+            dataset = os.path.basename(file_path)
+            image_folder = get_image_folder(dataset)
+            row = dict.fromkeys(("items", "resumed", "duplicates", "cached", "requests", "input_tokens", "output_tokens"), 0)
+            for item in iter_shard_items(file_path, model_key, shard):
+                task = (model_key, dataset, item["idx"])
+                text = USER_PROMPT.format(en=item["en"])
+                row["items"] += 1
+                if done.get(task, (None, False))[1]:
+                    row["resumed"] += 1
+                elif plan and plan.leader_of(task):
+                    row["duplicates"] += 1
+                elif is_cached(config['model_name'], text, os.path.join(image_folder, item["image"]),
+                               config['extra_body'], config['image_policy'], options):
+                    row["cached"] += 1
                 else:
-                    item["error"] = str(e)
-                    outputs = ""
-                    break
+                    row["requests"] += 1
+                    row["input_tokens"] += estimate_request_tokens(text) - ANSWER_TOKEN_ESTIMATE
+                    row["output_tokens"] += ANSWER_TOKEN_ESTIMATE
+            row["cost"] = estimate_cost(config, row["input_tokens"], row["output_tokens"])
+            rows[f"{model_key} / {dataset}"] = row
+    return rows
+
+def estimate_cost(config, input_tokens, output_tokens):
+    """按注册表中每百万 token 的价格估算费用（美元），价格未知时返回 None。"""
+    if config['input_price'] is None or config['output_price'] is None:
+        return None
+    return (input_tokens * config['input_price'] + output_tokens * config['output_price']) / 1e6
+
+def format_plan(rows):
+    lines = [f"{'':<48} {'items':>6} {'resumed':>7} {'dup':>5} {'cached':>6} {'requests':>8} "
+             f"{'in tokens':>10} {'out tokens':>10} {'cost $':>8}"]
+    total_cost = 0.0
+    unknown = False
+    for name, row in rows.items():
+        cost = f"{row['cost']:.2f}" if row['cost'] is not None else '-'
+        if row['cost'] is None:
+            unknown = unknown or row['requests'] > 0
         else:
-            print(f"Skipping {idx}")
-            outputs = ""
-            if last_error:
-                item["error"] = str(last_error)
+            total_cost += row['cost']
+        lines.append(
+            f"{name:<48} {row['items']:>6} {row['resumed']:>7} {row['duplicates']:>5} {row['cached']:>6} "
+            f"{row['requests']:>8} {row['input_tokens']:>10} {row['output_tokens']:>10} {cost:>8}"
+        )
+    lines.append(
+        f"Total: {sum(row['requests'] for row in rows.values())} requests, estimated ${total_cost:.2f}"
+        + (" (models without input_price/output_price not included)" if unknown else "")
+    )
+    return "\n".join(lines)
 
-        item["result"] = outputs
-        result.append(item.copy())
+def run_batch(model_keys, data_files, run_id, resume=False, poll_interval=30, client=None, shard=None, dedup=True):
+    """
+    批处理模式：每个模型生成一个批处理文件并提交，全部提交后统一轮询，
+    完成后把结果写回断点文件，再按原有格式生成每个数据集的结果文件。
+    指定 shard、dedup 时与 run_all 相同。
+    """
+    client = client or get_client()
+    submitted = {}
+    plan = plan_duplicates(model_keys, data_files, shard) if dedup else None
 
-    output_filename = f"{model_key}-{today}"
-    output_path = os.path.join(OUTPUT_BASE_DIR, f"{output_filename}_{os.path.basename(file_path)}")
+    for model_key in model_keys:
+        config = get_model_config(model_key)
+        checkpoint = get_checkpoint(model_key, resume, shard)
+        name = f"{model_key}-{run_id}{shard_suffix(shard)}"
+        state_path = os.path.join(BATCH_DIR, f"{name}.batch.json")
+        jobs = []
+        for file_path in data_files:
+            if not os.path.exists(file_path):
+                print(f"Warning: File not found: {file_path}")
+                continue
+            jobs.append((file_path, os.path.basename(file_path)))
 
-    Path(OUTPUT_BASE_DIR).mkdir(parents=True, exist_ok=True)
+        def build_requests(model_key=model_key, config=config, checkpoint=checkpoint, jobs=jobs):
+            # 逐条编码并直接写入批处理文件，不在内存中保留全部请求
+            for file_path, dataset in jobs:
+                image_folder = get_image_folder(dataset)
+                for item in iter_shard_items(file_path, model_key, shard):
+                    if checkpoint.is_done(model_key, dataset, item["idx"]):
+                        continue
+                    if plan and plan.leader_of((model_key, dataset, item["idx"])):
+                        continue
+                    base64_image = encode_with_policy(os.path.join(image_folder, item["image"]), config['image_policy'])
+                    yield build_request(
+                        make_custom_id(model_key, dataset, item["idx"]),
+                        config['model_name'],
+                        USER_PROMPT.format(en=item["en"]),
+                        base64_image,
+                        config['extra_body']
+                    )
 
-    print(f"Saving results to: {output_path}")
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(result, f, ensure_ascii=False, indent=4)
+        batch_id = None
+        if resume and os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf-8') as f:
+                batch_id = json.load(f)["batch_id"]
+            print(f"Resuming batch {batch_id} for {model_key}")
+        else:
+            requests = [0]
+
+            def counted(requests=requests, source=build_requests()):
+                for request in source:
+                    requests[0] += 1
+                    yield request
+
+            batch_path = write_batch_file(os.path.join(BATCH_DIR, f"{name}.jsonl"), counted())
+            if requests[0]:
+                batch_id = submit_batch(client, batch_path, metadata={"model_key": model_key})
+                with open(state_path, 'w', encoding='utf-8') as f:
+                    json.dump({"batch_id": batch_id, "requests": requests[0]}, f)
+            else:
+                os.remove(batch_path)
+        submitted[model_key] = (batch_id, checkpoint, jobs)
+
+    for model_key, (batch_id, checkpoint, jobs) in submitted.items():
+        results = {}
+        status = "not submitted"
+        if batch_id:
+            batch = wait_for_batch(client, batch_id, poll_interval)
+            status = batch.status
+            results = read_batch_results(client, batch, stream_model=get_model_config(model_key)['return_reasoning'])
+        for file_path, dataset in jobs:
+            for item in iter_shard_items(file_path, model_key, shard):
+                task = (model_key, dataset, item["idx"])
+                if checkpoint.is_done(*task):
+                    continue
+                leader = plan.leader_of(task) if plan else None
+                if leader:
+                    # 重复的条目使用 leader 的结果（本次批处理或之前已完成的断点）
+                    leader_id = make_custom_id(*leader)
+                    if leader_id in results:
+                        outputs, error = results[leader_id]
+                        record = {"result": outputs, "error": error} if error else {"result": outputs}
+                    elif checkpoint.is_done(*leader):
+                        record = checkpoint.get(*leader)
+                    else:
+                        record = {"result": "", "error": f"Missing from batch {batch_id} ({status})"}
+                    checkpoint.append(model_key, dataset, duplicate_result(item, leader, record))
+                    continue
+                outputs, error = results.get(
+                    make_custom_id(*task), ("", f"Missing from batch {batch_id} ({status})")
+                )
+                if error:
+                    item["error"] = error
+                item["result"] = outputs
+                checkpoint.append(model_key, dataset, item)
+
+        if shard is None:
+            for file_path, dataset in jobs:
+                save_results(
+                    checkpoint.collect(model_key, dataset, iter_items(file_path)), file_path, model_key, run_id
+                )
+        checkpoint.close()
+
+def merge_shards(model_keys, data_files, run_id):
+    """
+    合并各分片的断点文件，按数据文件中的原始顺序生成与单机运行相同的结果文件。
+    缺失的条目（分片未完成）记为 error，可在对应分片上 --resume 补跑后重新合并。
+    """
+    for model_key in model_keys:
+        paths = shard_checkpoint_paths(CHECKPOINT_DIR, model_key)
+        if not paths:
+            print(f"Warning: No shard checkpoints found for {model_key}")
+            continue
+        records = merge_records(paths)
+        files = {path: open(path, 'rb') for path in paths}
+        try:
+            for file_path in data_files:
+                if not os.path.exists(file_path):
+                    print(f"Warning: File not found: {file_path}")
+                    continue
+                dataset = os.path.basename(file_path)
+                counts = {"total": 0, "missing": 0}
+
+                def merged(dataset=dataset, file_path=file_path, counts=counts):
+                    for item in iter_items(file_path):
+                        counts["total"] += 1
+                        location = records.get((model_key, dataset, item["idx"]))
+                        if location is None:
+                            counts["missing"] += 1
+                            yield dict(item, result="", error="Missing from shard checkpoints")
+                        else:
+                            yield read_record(files[location[0]], location[1])["item"]
+
+                save_results(merged(), file_path, model_key, run_id)
+                if counts["missing"]:
+                    print(
+                        f"Warning: {model_key} on {dataset}: {counts['missing']} of {counts['total']} items "
+                        f"missing from {len(paths)} shard files"
+                    )
+        finally:
+            for f in files.values():
+                f.close()
+
+def merge_run_manifests(model_keys, data_files, run_id):
+    """
+    把各分片的运行清单合并为 runs/{run_id}.json，并加入 merge_shards 生成的结果文件的错误分类与质量分数。
+    各分片需使用相同的 --run-id 运行。返回清单路径，没有找到分片清单时返回 None。
+    """
+    paths = shard_manifest_paths(run_id, RUNS_DIR)
+    if not paths:
+        print(f"Warning: No shard manifests found for run {run_id}; run the shards and --merge with the same --run-id")
+        return None
+    manifest = RunManifest.combine([load_manifest(path) for path in paths])
+    for model_key in model_keys:
+        for file_path in data_files:
+            output_path = get_output_path(file_path, model_key, run_id)
+            if os.path.exists(output_path):
+                manifest.add_output(model_key, os.path.basename(file_path), output_path)
+    manifest.finish()
+    # 合并清单完全由各分片清单生成，重新合并时直接覆盖
+    return manifest.write(RUNS_DIR, replace=True)
 
 # ========================== 主函数 ==========================
 def main():
@@ -201,43 +844,302 @@ def main():
     parser.add_argument(
         '--model',
         type=str,
-        nargs='+',  
-        choices=[
-            'gpt-4o', 'o1', 'qvq', 'qwen',
-            'gemini-2.0-flash', 'claude-3-7-sonnet',
-            'gemini-2.5-flash', 'gemini-2.5-pro',
-            'all'
-        ],
+        nargs='+',
         default=['all'],
-        help="Specify which model(s) to run: gpt-4o, o1, qvq, qwen, gemini-2.0-flash, claude-3-7-sonnet, gemini-2.5-flash, gemini-2.5-pro, or all"
+        help=f"Specify which model(s) to run: {', '.join(MODEL_REGISTRY)}, or all"
+    )
+    parser.add_argument(
+        '--model-config',
+        type=str,
+        default=None,
+        help="JSON file with per-model overrides of the registry, e.g. {\"o1\": {\"concurrency\": 2}}"
+    )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=None,
+        help="Maximum number of in-flight API requests per model (overrides the registry for all models)"
+    )
+    parser.add_argument(
+        '--model-concurrency',
+        type=str,
+        nargs='+',
+        default=[],
+        metavar='MODEL=N',
+        help="Per-model concurrency overrides, e.g. --model-concurrency o1=2 gemini-2.0-flash=16"
+    )
+    parser.add_argument(
+        '--rpm',
+        type=int,
+        default=None,
+        help="Requests per minute allowed for each model (overrides the registry)"
+    )
+    parser.add_argument(
+        '--tpm',
+        type=int,
+        default=None,
+        help="Estimated tokens per minute allowed for each model (overrides the registry)"
+    )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help="Use streaming calls for every selected model (required for the token caps below)"
+    )
+    parser.add_argument(
+        '--max-answer-tokens',
+        type=int,
+        default=None,
+        help="Cancel a streamed request once the answer exceeds this many estimated tokens and keep the partial answer"
+    )
+    parser.add_argument(
+        '--max-reasoning-tokens',
+        type=int,
+        default=None,
+        help="Cancel a streamed request once the streamed reasoning exceeds this many estimated tokens and mark the item as failed"
+    )
+    parser.add_argument(
+        '--max-retries',
+        type=int,
+        default=5,
+        help="Maximum retries for rate-limited or transient errors; 400-class errors are never retried"
+    )
+    parser.add_argument(
+        '--max-connections',
+        type=int,
+        default=None,
+        help="Size of the shared HTTP connection pool (default: total concurrency of the selected models plus headroom)"
+    )
+    parser.add_argument(
+        '--http2',
+        action='store_true',
+        help="Use HTTP/2 for API connections (requires the h2 package)"
+    )
+    parser.add_argument(
+        '--cache',
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Reuse cached API responses for identical (model, prompt, image, extra_body) requests"
+    )
+    parser.add_argument(
+        '--cache-max-mb',
+        type=int,
+        default=1024,
+        help="Size cap of the response cache; least recently used entries are evicted beyond it"
+    )
+    parser.add_argument(
+        '--image-cache',
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Persist preprocessed image payloads on disk so each image is encoded only once"
+    )
+    parser.add_argument(
+        '--dedup',
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Send identical (model, prompt, image) tasks across all data files only once and copy the result"
+    )
+    parser.add_argument(
+        '--adaptive',
+        action='store_true',
+        help="Adjust in-flight requests per model with AIMD: grow while latency and errors stay healthy, "
+             "halve on 429s, timeouts, 5xx or latency spikes (starts at --concurrency)"
+    )
+    parser.add_argument(
+        '--max-concurrency',
+        type=int,
+        default=None,
+        help="Upper bound for --adaptive (default: 4x the starting concurrency)"
+    )
+    parser.add_argument(
+        '--budget',
+        type=float,
+        default=None,
+        metavar='USD',
+        help="Per-model spending cap for this run, computed from response usage and the registry prices; "
+             "once reached the model stops sending requests"
+    )
+    parser.add_argument(
+        '--hedge',
+        type=float,
+        default=None,
+        metavar='PERCENTILE',
+        help="Send a duplicate request when an item has not answered by this latency percentile of the model "
+             "(e.g. 95); the first reply wins and the other is cancelled"
+    )
+    parser.add_argument(
+        '--deadline',
+        type=float,
+        default=None,
+        metavar='SECONDS',
+        help="Hard per-request deadline; requests still running after it are cancelled and the item is marked as failed"
+    )
+    parser.add_argument(
+        '--pack',
+        type=int,
+        default=None,
+        metavar='N',
+        help="Translate up to N sentences that share an image in one request (JSON list reply, per-item fallback)"
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help="Skip items already completed successfully in the checkpoint files"
+    )
+    parser.add_argument(
+        '--shard',
+        type=parse_shard,
+        default=None,
+        metavar='i/N',
+        help="Only process the i-th of N deterministic shards of the (model, dataset, idx) tasks (i starts at 0)"
+    )
+    parser.add_argument(
+        '--merge',
+        action='store_true',
+        help="Merge the shard checkpoints of the selected models into the usual result files, without calling the API"
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help="List the tasks, skip those already in the checkpoint (--resume) or response cache (--cache) and "
+             "estimate tokens and cost, without calling the API"
+    )
+    parser.add_argument(
+        '--batch',
+        action='store_true',
+        help="Submit requests through the provider batch API instead of real-time calls"
+    )
+    parser.add_argument(
+        '--run-id',
+        type=str,
+        default=None,
+        help="Run id used in result file names and the run manifest, YYYY-MM-DD or YYYY-MM-DD-HHMMSS-xxxx "
+             "(default: current date and time plus 4 random hex digits); "
+             "reuse an id only with --resume (the run is added to its manifest, and --batch keeps polling its batches); "
+             "use the same id for every --shard and for --merge to get one combined manifest"
+    )
+    parser.add_argument(
+        '--batch-poll-interval',
+        type=int,
+        default=30,
+        help="Seconds between batch status polls"
     )
 
     args = parser.parse_args()
+    if args.model_config:
+        load_overrides(args.model_config)
+    configure_cache(CACHE_PATH if args.cache else None, args.cache_max_mb * 1024 * 1024)
+    configure_images(IMAGE_CACHE_DIR if args.image_cache else None)
 
     if 'all' in args.model:
-        model_names = list(MODELS.keys())
+        model_names = list(MODEL_REGISTRY.keys())
     else:
         model_names = args.model
+    for model_key in model_names:
+        if model_key not in MODEL_REGISTRY:
+            parser.error(f"unknown model {model_key!r}, choose from: {', '.join(MODEL_REGISTRY)}, all")
+    # 结果文件名需要能被 metrics.OUTPUT_NAME 解析回 (模型, 运行, 数据集)
+    if args.run_id is not None and not RUN_ID.fullmatch(args.run_id):
+        parser.error(f"invalid --run-id {args.run_id!r}, expected YYYY-MM-DD or YYYY-MM-DD-HHMMSS-xxxx (xxxx: hex digits)")
+
+    overrides = {}
+    if args.stream:
+        overrides['stream'] = True
+    if args.max_answer_tokens:
+        overrides['max_answer_tokens'] = args.max_answer_tokens
+    if args.max_reasoning_tokens:
+        overrides['max_reasoning_tokens'] = args.max_reasoning_tokens
+    if args.hedge:
+        overrides['hedge_percentile'] = args.hedge
+    if args.deadline:
+        overrides['deadline'] = args.deadline
+    if args.adaptive:
+        overrides['adaptive'] = True
+    if args.max_concurrency:
+        overrides['max_concurrency'] = args.max_concurrency
+    if args.budget is not None:
+        overrides['budget'] = args.budget
+    if overrides:
+        apply_overrides({key: dict(overrides) for key in model_names})
 
     print(f"Running models: {model_names}")
 
-    today = datetime.date.today()
+    run_id = args.run_id or new_run_id()
+    print(f"Run id: {run_id}")
+    existing = manifest_path(run_id, args.shard, RUNS_DIR)
+    if not (args.merge or args.dry_run or args.resume) and os.path.exists(existing):
+        parser.error(f"run {run_id} already has a manifest ({existing}); pass --resume to continue it or use another --run-id")
 
     data_files = [AMBI_NORMAL_FILE, SP_FILE, MMA_FILE]
 
+    if args.merge:
+        merge_shards(model_names, data_files, run_id)
+        path = merge_run_manifests(model_names, data_files, run_id)
+        if path:
+            print(f"Run manifest saved to: {path}")
+        return
+    if args.dry_run:
+        print(format_plan(plan_run(model_names, data_files, args.resume, args.shard, args.dedup)))
+        return
+    if args.shard:
+        print(f"Running shard {args.shard[0]} of {args.shard[1]}")
+
+    concurrency = {key: args.concurrency or get_model_config(key)['concurrency'] for key in model_names}
+    for override in args.model_concurrency:
+        key, _, value = override.partition('=')
+        concurrency[key] = int(value)
+    print(f"Concurrency per model: {concurrency}")
+
+    for model_key in model_names:
+        config = get_model_config(model_key)
+        get_limiter(model_key, args.rpm or config['rpm'], args.tpm or config['tpm'])
+        if config['adaptive'] and not args.batch:
+            # 自适应模型的线程池按上限分配，实际在途请求数由 AIMD 控制器从初始并发开始调整
+            maximum = config['max_concurrency'] or 4 * concurrency[model_key]
+            enable_adaptive(model_key, concurrency[model_key], maximum)
+            concurrency[model_key] = maximum
+        if config['budget'] is not None:
+            try:
+                configure_budget(model_key, config['budget'], config['input_price'], config['output_price'])
+            except ValueError as e:
+                parser.error(str(e))
+
+    max_connections = args.max_connections or sum(concurrency.values()) + 8
+    configure_client(max_connections=max_connections, http2=args.http2, key_file=API_KEY_FILE)
+
+    manifest = RunManifest(run_id, options=vars(args), shard=args.shard)
+    manifest.add_prompt("user_prompt", USER_PROMPT)
+    if args.pack:
+        manifest.add_prompt("packed_prompt", PACKED_PROMPT)
+    for file_path in data_files:
+        if os.path.exists(file_path):
+            manifest.add_data_file(file_path)
+    for model_key in model_names:
+        manifest.add_model(model_key, get_model_config(model_key))
+
+    if args.batch:
+        run_batch(model_names, data_files, run_id, args.resume, args.batch_poll_interval, shard=args.shard, dedup=args.dedup)
+    else:
+        run_all(
+            model_names, data_files, run_id, concurrency, args.max_retries, args.resume, args.shard, args.dedup, args.pack,
+            manifest
+        )
+
+    stats = connection_stats()
+    print(
+        f"HTTP pool: {stats['requests']} requests over {stats['tcp_connects']} connections "
+        f"({stats['tls_handshakes']} TLS handshakes), peak {stats['peak_requests_in_flight']} in flight"
+    )
+
+    # 分片运行不生成结果文件，清单中只有耗时与用量
     for model_key in model_names:
-        model_name = MODELS[model_key]
-        print(f"\n{'='*50}")
-        print(f"Starting processing with model: {model_key} ({model_name})")
-        print(f"{'='*50}")
-        
         for file_path in data_files:
-            if os.path.exists(file_path):
-                process_single_file(file_path, model_key, model_name, today)
-            else:
-                print(f"Warning: File not found: {file_path}")
-        
-        print(f"Completed processing with model: {model_key}")
+            output_path = get_output_path(file_path, model_key, run_id)
+            if args.shard is None and os.path.exists(output_path):
+                manifest.add_output(model_key, os.path.basename(file_path), output_path)
+    manifest.add_report("connections", stats)
+    manifest.finish()
+    # --resume 时与同一运行（同一分片）之前的清单合并，不会覆盖之前的记录
+    print(f"Run manifest saved to: {manifest.write(RUNS_DIR, resume=args.resume)}")
 
     print("\nAll processing completed!")
 
@@ -0,0 +1,38 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+import dataio
+
+ITEMS = [
+    15000000000.0,
+    {"idx": 1, "en": "a bank", "score": 1.5e-3},
+    -0.25,
+    [1, 2.5, "x"],
+    "text",
+    True,
+    None,
+    12,
+]
+
+
+@pytest.mark.parametrize('indent', [None, 4])
+def test_iter_json_array_at_every_chunk_size(tmp_path, monkeypatch, indent):
+    path = tmp_path / 'items.json'
+    text = json.dumps(ITEMS, indent=indent)
+    path.write_text(text, encoding='utf-8')
+    for size in range(1, len(text) + 2):
+        monkeypatch.setattr(dataio, 'READ_CHUNK_SIZE', size)
+        assert list(dataio.iter_items(str(path))) == ITEMS, size
+
+
+def test_iter_json_array_rejects_missing_separator(tmp_path, monkeypatch):
+    path = tmp_path / 'bad.json'
+    path.write_text('[1 2]', encoding='utf-8')
+    monkeypatch.setattr(dataio, 'READ_CHUNK_SIZE', 1)
+    with pytest.raises(ValueError):
+        list(dataio.iter_items(str(path)))